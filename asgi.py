@@ -0,0 +1,3 @@
+"""ASGI App entry point (Python 3.5+), e.g., uvicorn asgi:application"""
+
+from yagcil.asgi import application
@@ -0,0 +1,6 @@
+"""
+    yagcil-server benchmarks
+
+    Run the benchmarks from the repository root, e.g.,
+    YAGCIL_TEST=True python -m benchmarks.stream_memory
+"""
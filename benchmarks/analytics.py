@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""Leaderboard and category statistics: Python loops vs NumPy
+
+Works on synthetic integer-coded columns, no database is needed.
+"""
+import argparse
+import os
+import random
+import time
+from array import array
+from collections import defaultdict
+
+os.environ.setdefault('YAGCIL_TEST', 'true')
+
+from yagcil import analytics
+
+
+def python_rank(students, rows, names):
+    """Rank students with a per-row loop (Snapshot without NumPy)"""
+    counts = defaultdict(int)
+    for row in rows:
+        counts[students[row]] += 1
+
+    return sorted(counts.items(), key=lambda x: (-x[1], names[x[0]]))
+
+
+def python_categories(offsets, categories, rows):
+    """Count categories with a per-row loop (Snapshot without NumPy)"""
+    counts = defaultdict(int)
+    for row in rows:
+        for category in categories[offsets[row]:offsets[row + 1]]:
+            counts[category] += 1
+
+    return counts
+
+
+def timed(function, *args):
+    start = time.time()
+    function(*args)
+
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--tasks', type=int, default=1000000, help='Number of tasks'
+    )
+    parser.add_argument(
+        '--students', type=int, default=20000, help='Number of students'
+    )
+    parser.add_argument(
+        '--orgs', type=int, default=50, help='Number of organizations'
+    )
+    args = parser.parse_args()
+    if not analytics.available:
+        parser.error('NumPy is not installed')
+
+    np = analytics.np
+    rnd = random.Random(0)
+    names = ['Student {0}'.format(i) for i in range(args.students)]
+    students = array('i', (
+        rnd.randrange(args.students) for _ in range(args.tasks)
+    ))
+    orgs = array('i', (rnd.randrange(args.orgs) for _ in range(args.tasks)))
+    offsets = array('i', [0])
+    categories = array('i')
+    for _ in range(args.tasks):
+        categories.extend(rnd.sample(range(5), rnd.randint(1, 2)))
+        offsets.append(len(categories))
+    rows = array('i', range(args.tasks))
+    # Rows of each organization, the same as Snapshot.by_org
+    org_rows = defaultdict(lambda: array('i'))
+    for row in rows:
+        org_rows[orgs[row]].append(row)
+
+    np_students = analytics.as_codes(students)
+    np_rows = analytics.as_codes(rows)
+    np_offsets = analytics.as_codes(offsets)
+    np_categories = analytics.as_codes(categories)
+    ranks = analytics.name_ranks(names)
+
+    results = [
+        ('year rank', timed(python_rank, students, rows, names), timed(
+            analytics.rank, np_students[np_rows], ranks
+        )),
+        ('org ranks', timed(
+            lambda: [
+                python_rank(students, org_rows[org], names)
+                for org in range(args.orgs)
+            ]
+        ), timed(
+            lambda: [
+                analytics.rank(
+                    np_students[analytics.as_codes(org_rows[org])], ranks
+                )
+                for org in range(args.orgs)
+            ]
+        )),
+        ('categories', timed(
+            python_categories, offsets, categories, rows
+        ), timed(
+            lambda: analytics.histogram(
+                analytics.gather(np_offsets, np_categories, np_rows), 5
+            )
+        ))
+    ]
+
+    print('{0} tasks, NumPy {1}'.format(args.tasks, np.__version__))
+    print('{0:<16} {1:>10} {2:>10} {3:>8}'.format(
+        '', 'python s', 'numpy s', 'speedup'
+    ))
+    for name, python, numpy in results:
+        print('{0:<16} {1:>10.3f} {2:>10.3f} {3:>7.1f}x'.format(
+            name, python, numpy, python / numpy
+        ))
+
+
+if __name__ == '__main__':
+    main()
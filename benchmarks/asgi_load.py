@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""Throughput of the WSGI and the ASGI serving modes
+
+The WSGI app is served by a fixed number of worker threads, each blocked
+for the whole request. The ASGI app runs in one event loop with the same
+number of threads, the queries of its async resources run in the loop
+without holding a thread, so up to --concurrency requests wait for
+MongoDB at once. Requires Python 3.5+, motor and a local MongoDB
+instance.
+"""
+import argparse
+import asyncio
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+os.environ.setdefault('YAGCIL_TEST', 'true')
+
+import mongoengine as me
+
+from yagcil import app
+from yagcil.asgi import AsyncApp
+from benchmarks.datagen import DB_NAME, generate
+
+PATHS = [
+    '/organization/all',
+    '/organization/2014/org0',
+    '/task/1',
+    '/student/Student 0/2014',
+    '/student/Student 1/2014/org0/',
+    '/organization/2014/rank'
+]
+
+
+def run_sync(paths, workers):
+    """Serve the requests by the WSGI app
+
+    :return float Requests per second
+    """
+    def get(path):
+        rv = app.test_client().get(path)
+        rv.get_data()
+
+    pool = ThreadPool(workers)
+    start = time.time()
+    pool.map(get, paths, chunksize=1)
+    elapsed = time.time() - start
+    pool.close()
+
+    return len(paths) / elapsed
+
+
+async def get_async(application, path, semaphore):
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': b'',
+        'headers': [],
+        'server': ('localhost', 80)
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    async with semaphore:
+        await application(scope, receive, send)
+
+
+def run_async(paths, workers, concurrency):
+    """Serve the requests by the ASGI app
+
+    :return float Requests per second
+    """
+    application = AsyncApp(app, db_name=DB_NAME, workers=workers)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    start = time.time()
+    loop.run_until_complete(asyncio.gather(*[
+        get_async(application, path, semaphore) for path in paths
+    ]))
+    elapsed = time.time() - start
+    loop.close()
+
+    return len(paths) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--tasks', type=int, default=100000, help='Number of tasks'
+    )
+    parser.add_argument(
+        '--requests', type=int, default=3000, help='Number of requests'
+    )
+    parser.add_argument(
+        '--workers', type=int, nargs='+', default=[1, 4, 16],
+        help='Worker thread counts'
+    )
+    parser.add_argument(
+        '--concurrency', type=int, default=64,
+        help='Concurrent requests of the ASGI app'
+    )
+    args = parser.parse_args()
+
+    app.config['YEARS'] = [2014]
+    app.config['RESPONSE_CACHE'] = False
+
+    db = me.connect(DB_NAME)
+    db.drop_database(DB_NAME)
+    generate(tasks=args.tasks, zipf=1.1)
+    paths = [PATHS[i % len(PATHS)] for i in range(args.requests)]
+    try:
+        for workers in args.workers:
+            sync = run_sync(paths, workers)
+            async_ = run_async(paths, workers, args.concurrency)
+            print('{0:3} workers: wsgi {1:8.1f} req/s, asgi {2:8.1f} req/s '
+                  '({3:.2f}x)'.format(workers, sync, async_, async_ / sync))
+    finally:
+        db.drop_database(DB_NAME)
+
+
+if __name__ == '__main__':
+    main()
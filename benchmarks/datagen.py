@@ -0,0 +1,86 @@
+"""
+    Synthetic GCI data generator
+"""
+import bisect
+import random
+
+from yagcil.models import Organization, Task
+
+DB_NAME = 'yagcil-benchmark'
+CATEGORIES = [
+    'Code', 'User Interface', 'Documentation/Training',
+    'Outreach/Research', 'Quality Assurance'
+]
+
+
+class ZipfSampler(object):
+    """Sample ranks 0..n-1 with probability proportional to 1/(rank+1)^s
+
+    A few students close most of the tasks, like in real GCI data.
+    """
+
+    def __init__(self, n, s, rnd):
+        self.rnd = rnd
+        self.cumulative = []
+        total = 0.0
+        for rank in range(1, n + 1):
+            total += 1.0 / rank ** s
+            self.cumulative.append(total)
+
+    def sample(self):
+        point = self.rnd.random() * self.cumulative[-1]
+
+        return bisect.bisect(self.cumulative, point)
+
+
+def generate(years=(2014,), orgs=20, students=1000, tasks=10000, seed=0,
+             batch_size=10000, zipf=None, max_categories=2):
+    """Fill the database with synthetic organizations and tasks
+
+    Documents are inserted with raw bulk inserts, so generating millions
+    of tasks takes seconds.
+
+    :param years list GCI years to generate
+    :param orgs int Number of organizations in each year
+    :param students int Number of students in each year
+    :param tasks int Number of tasks in each year
+    :param seed int Random seed
+    :param batch_size int Number of tasks inserted at once
+    :param zipf float Exponent of the Zipfian tasks per student
+    distribution (default: uniform distribution)
+    :param max_categories int Maximum number of categories of a task
+    """
+    rnd = random.Random(seed)
+    if zipf is not None:
+        sample_student = ZipfSampler(students, zipf, rnd).sample
+    else:
+        def sample_student():
+            return rnd.randrange(students)
+    max_categories = min(max_categories, len(CATEGORIES))
+    key = 1
+    for year in years:
+        org_ids = Organization._get_collection().insert_many([{
+            'name': 'org{0}'.format(i),
+            'full_name': 'Organization {0}'.format(i),
+            'year': year
+        } for i in range(orgs)]).inserted_ids
+
+        batch = []
+        for i in range(tasks):
+            batch.append({
+                '_id': key,
+                'year': year,
+                'org': rnd.choice(org_ids),
+                'student': 'Student {0}'.format(sample_student()),
+                'title': 'Task {0}'.format(key),
+                'categories': rnd.sample(
+                    CATEGORIES, rnd.randint(1, max_categories)
+                )
+            })
+            key += 1
+            if len(batch) == batch_size:
+                Task._get_collection().insert_many(batch, ordered=False)
+                batch = []
+
+        if batch:
+            Task._get_collection().insert_many(batch, ordered=False)
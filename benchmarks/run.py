@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""Latency, throughput and MongoDB commands of every resource
+
+Every resource is requested through the Flask test client against a
+synthetic dataset. Results are written to a JSON file, pass a previous
+one as --compare to see the change between commits. Requires a local
+MongoDB instance.
+"""
+import argparse
+import json
+import os
+import subprocess
+import time
+
+try:
+    from urllib.parse import quote, unquote
+except ImportError:
+    from urllib import quote, unquote
+
+os.environ.setdefault('YAGCIL_TEST', 'true')
+
+import mongoengine as me
+
+from yagcil import app
+from yagcil.metrics import registry
+from yagcil.models import Leaderboard
+from yagcil.snapshot import snapshots
+from benchmarks.datagen import DB_NAME, generate
+
+
+def scenarios(year):
+    """Get requests driving every resource
+
+    :return list (name, method, path, JSON body) tuples
+    """
+    org = 'org0'
+    student = quote('Student 0')
+
+    return [
+        ('root', 'GET', '/', None),
+        ('config', 'GET', '/config', None),
+        ('organization_list', 'GET', '/organization?year={0}'.format(year),
+         None),
+        ('all_organization_list', 'GET', '/organization/all', None),
+        ('organization', 'GET', '/organization/{0}/{1}'.format(year, org),
+         None),
+        ('rank', 'GET', '/organization/{0}/rank'.format(year), None),
+        ('org_rank', 'GET', '/organization/{0}/{1}/rank'.format(year, org),
+         None),
+        ('stats', 'GET', '/organization/{0}/stats'.format(year), None),
+        ('org_stats', 'GET', '/organization/{0}/{1}/stats'.format(year, org),
+         None),
+        ('task_list', 'GET', '/task?year={0}&limit=100'.format(year), None),
+        ('org_task_list', 'GET',
+         '/task?year={0}&org={1}&limit=100'.format(year, org), None),
+        ('task', 'GET', '/task/1', None),
+        ('student', 'GET', '/student/{0}/{1}'.format(student, year), None),
+        ('student_org', 'GET',
+         '/student/{0}/{1}/{2}/'.format(student, year, org), None),
+        ('batch', 'POST', '/batch', {'requests': [
+            '/organization/{0}/rank'.format(year),
+            '/organization/{0}/stats'.format(year),
+            '/student/{0}/{1}'.format(student, year)
+        ]})
+    ]
+
+
+def percentile(values, fraction):
+    """Get a percentile of sorted values"""
+    return values[int(round(fraction * (len(values) - 1)))]
+
+
+def measure(client, method, path, body, repeat):
+    """Request a path repeatedly
+
+    :return dict Latency percentiles, throughput and MongoDB commands
+    per request
+    """
+    endpoint, _ = app.url_map.bind('').match(
+        unquote(path.split('?')[0]), method
+    )
+    commands = registry.counter('yagcil_mongo_commands_total', endpoint)
+    data = json.dumps(body) if body is not None else None
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.time()
+        rv = client.open(
+            path, method=method, data=data, content_type='application/json'
+        )
+        rv.get_data()
+        latencies.append(time.time() - start)
+        if rv.status_code != 200:
+            raise RuntimeError('{0} {1}: {2}'.format(
+                method, path, rv.status_code
+            ))
+
+    commands = registry.counter(
+        'yagcil_mongo_commands_total', endpoint
+    ) - commands
+    latencies.sort()
+
+    return {
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'throughput': repeat / sum(latencies),
+        'queries': float(commands) / repeat
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD']
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    baseline = baseline or {}
+    for name in sorted(results):
+        result = results[name]
+        line = (
+            '{0:24} p50 {1:8.2f} ms  p99 {2:8.2f} ms  {3:8.1f} req/s  '
+            '{4:6.1f} queries'.format(
+                name, result['p50_ms'], result['p99_ms'],
+                result['throughput'], result['queries']
+            )
+        )
+        if name in baseline:
+            line += '  ({0:.2f}x throughput)'.format(
+                result['throughput'] / baseline[name]['throughput']
+            )
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--years', type=int, nargs='+', default=[2014], help='GCI years'
+    )
+    parser.add_argument(
+        '--orgs', type=int, default=20, help='Organizations per year'
+    )
+    parser.add_argument(
+        '--students', type=int, default=2000, help='Students per year'
+    )
+    parser.add_argument(
+        '--tasks', type=int, default=100000, help='Tasks per year'
+    )
+    parser.add_argument(
+        '--zipf', type=float, default=1.1,
+        help='Exponent of the tasks per student distribution'
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=100, help='Requests per resource'
+    )
+    parser.add_argument(
+        '--cache', action='store_true', help='Enable the response cache'
+    )
+    parser.add_argument(
+        '--snapshot', action='store_true', help='Enable the snapshot engine'
+    )
+    parser.add_argument(
+        '-o', '--output', default='benchmark.json', help='Results file'
+    )
+    parser.add_argument(
+        '--compare', help='Results file of a previous run'
+    )
+    args = parser.parse_args()
+
+    app.config['YEARS'] = args.years
+    app.config['RESPONSE_CACHE'] = args.cache
+    app.config['SNAPSHOT_ENGINE'] = args.snapshot
+
+    db = me.connect(DB_NAME)
+    db.drop_database(DB_NAME)
+    generate(
+        years=args.years, orgs=args.orgs, students=args.students,
+        tasks=args.tasks, zipf=args.zipf, max_categories=3
+    )
+    Leaderboard.materialize(args.years)
+    if args.snapshot:
+        snapshots.reload()
+    try:
+        client = app.test_client()
+        results = {}
+        for name, method, path, body in scenarios(max(args.years)):
+            results[name] = measure(client, method, path, body, args.repeat)
+    finally:
+        db.drop_database(DB_NAME)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'revision': git_revision(),
+            'dataset': {
+                'years': args.years,
+                'orgs': args.orgs,
+                'students': args.students,
+                'tasks': args.tasks,
+                'zipf': args.zipf
+            },
+            'config': {'cache': args.cache, 'snapshot': args.snapshot},
+            'repeat': args.repeat,
+            'results': results
+        }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Rows per second of the document and the raw serialization paths
+
+Both paths query MongoDB on every measurement and resolve organization
+names through the organization cache. Requires a local MongoDB instance.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('YAGCIL_TEST', 'true')
+
+import mongoengine as me
+
+from yagcil.helpers import tasks_to_dict
+from yagcil.models import Task
+from benchmarks.datagen import DB_NAME, generate
+
+
+def document_path(tasks):
+    """Serialize tasks by building model instances (the old path)"""
+    return [task.to_dict() for task in tasks.no_cache()]
+
+
+def measure(serialize, repeat):
+    """Get the best rows per second of a serialization path"""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        rows = len(serialize(Task.objects(year=2014)))
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return rows / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--tasks', type=int, default=100000, help='Number of tasks'
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='Number of measurements'
+    )
+    args = parser.parse_args()
+
+    db = me.connect(DB_NAME)
+    db.drop_database(DB_NAME)
+    generate(tasks=args.tasks)
+    try:
+        document = measure(document_path, args.repeat)
+        raw = measure(tasks_to_dict, args.repeat)
+    finally:
+        db.drop_database(DB_NAME)
+
+    print('document: {0:12.0f} rows/s'.format(document))
+    print('raw:      {0:12.0f} rows/s ({1:.1f}x)'.format(raw, raw / document))
+
+
+if __name__ == '__main__':
+    main()
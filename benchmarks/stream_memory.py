@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Peak memory of streamed task lists
+
+Every dataset size is streamed in a separate process, because the peak
+RSS of a process never decreases. The data is generated by the parent
+process, so the child's peak only grows by streaming. Requires a local
+MongoDB instance.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+
+os.environ.setdefault('YAGCIL_TEST', 'true')
+
+import mongoengine as me
+
+from yagcil import app
+from yagcil.helpers import NDJSON_MIMETYPE
+from benchmarks.datagen import DB_NAME, generate
+
+
+def peak_rss():
+    """Get the peak RSS of the process (kB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(ndjson=False):
+    """Stream the generated task list
+
+    :return tuple (peak RSS growth in kB, received bytes)
+    """
+    me.connect(DB_NAME)
+    client = app.test_client()
+    before = peak_rss()
+    rv = client.get(
+        '/task?year=2014&stream=true', buffered=False,
+        headers={'Accept': NDJSON_MIMETYPE if ndjson else 'application/json'}
+    )
+    received = 0
+    for chunk in rv.response:
+        received += len(chunk)
+    rv.close()
+
+    return peak_rss() - before, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--sizes', type=int, nargs='+',
+        default=[10000, 100000, 1000000],
+        help='Numbers of tasks to stream'
+    )
+    parser.add_argument(
+        '--ndjson', action='store_true', default=False,
+        help='Stream NDJSON instead of a JSON array'
+    )
+    parser.add_argument(
+        '--child', action='store_true', default=False, help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+
+    if args.child:
+        growth, received = measure(args.ndjson)
+        print('{0} {1}'.format(growth, received))
+        return
+
+    db = me.connect(DB_NAME)
+    print('{0:>10} {1:>14} {2:>16}'.format('tasks', 'RSS growth kB', 'bytes'))
+    try:
+        for size in args.sizes:
+            db.drop_database(DB_NAME)
+            generate(tasks=size)
+            command = [
+                sys.executable, '-m', 'benchmarks.stream_memory', '--child'
+            ]
+            if args.ndjson:
+                command.append('--ndjson')
+            output = subprocess.check_output(command).decode().split()
+            print('{0:>10} {1:>14} {2:>16}'.format(size, *output))
+    finally:
+        db.drop_database(DB_NAME)
+
+
+if __name__ == '__main__':
+    main()
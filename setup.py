@@ -50,7 +50,7 @@ setup(
     author='Yagcil Team',
     url='http://github.com/yagcil/yagcil-server',
     license='AGPLv3',
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
     zip_safe=False,
 
     install_requires=install_requires,
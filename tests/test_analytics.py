@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Test vectorized statistics"""
+import unittest
+import random
+from array import array
+from collections import Counter
+
+from yagcil import analytics
+
+
+@unittest.skipUnless(analytics.available, 'NumPy is not installed')
+class AnalyticsTestCase(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(0)
+        self.names = ['Student {0}'.format(i) for i in range(50)]
+        self.students = array('i', (rnd.randrange(50) for _ in range(1000)))
+        self.rows = array('i', sorted(rnd.sample(range(1000), 300)))
+        self.categories = [
+            [rnd.randrange(5) for _ in range(rnd.randrange(3))]
+            for _ in range(1000)
+        ]
+        self.ranks = analytics.name_ranks(self.names)
+
+    def __expected_rank(self, rows):
+        counts = Counter(self.students[row] for row in rows)
+        return sorted(
+            counts.items(), key=lambda x: (-x[1], self.names[x[0]])
+        )
+
+    def test_rank(self):
+        students = analytics.as_codes(self.students)
+        codes, counts = analytics.rank(
+            students[analytics.as_codes(self.rows)], self.ranks
+        )
+        self.assertEqual(
+            list(zip(codes.tolist(), counts.tolist())),
+            self.__expected_rank(self.rows)
+        )
+
+        codes, counts = analytics.rank(students[:0], self.ranks)
+        self.assertEqual(len(codes), 0)
+
+    def test_categories(self):
+        offsets = array('i', [0])
+        values = array('i')
+        for categories in self.categories:
+            values.extend(categories)
+            offsets.append(len(values))
+
+        gathered = analytics.gather(
+            analytics.as_codes(offsets), analytics.as_codes(values),
+            analytics.as_codes(self.rows)
+        )
+        expected = [x for row in self.rows for x in self.categories[row]]
+        self.assertEqual(gathered.tolist(), expected)
+
+        codes, counts = analytics.histogram(gathered, 5)
+        self.assertEqual(
+            dict(zip(codes.tolist(), counts.tolist())), Counter(expected)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""Test the ASGI serving mode"""
+import json
+import unittest
+
+import mongoengine as me
+
+from yagcil import app
+from yagcil.cache import generation
+from yagcil.models import Organization, Task, Leaderboard
+
+try:
+    import asyncio
+    from yagcil import asgi
+    from yagcil.asgi import AsyncApp
+    from yagcil.resources import TaskResource
+except (ImportError, SyntaxError):
+    # Python 2 or motor is not installed
+    AsyncApp = None
+
+TEST_DB_NAME = 'yagcil-test'
+NAMES = [u'Jos\u00e9', u'Jos\u00e8', u'\u0418\u0432\u0430\u043d']
+
+
+@unittest.skipUnless(AsyncApp, 'Python 3.5+ and motor are required')
+class AsgiTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = me.connect(TEST_DB_NAME)
+        self.db.drop_database(TEST_DB_NAME)
+        self.config = dict(app.config)
+        app.config['YEARS'] = [2011, 2012]
+        app.config['RESPONSE_CACHE'] = False
+        app.config['SNAPSHOT_ENGINE'] = False
+
+        orga = Organization(name='orga', full_name='Org A', year=2012).save()
+        orgb = Organization(name='orgb', full_name='Org B', year=2012).save()
+        Organization(name='orgc', full_name='Org C', year=2011).save()
+        Task(
+            key=1, year=2012, org=orga, student='Student A', title='Task A',
+            categories=['cat_A']
+        ).save()
+        Task(
+            key=2, year=2012, org=orgb, student='Student A', title='Task B',
+            categories=['cat_A', 'cat_B']
+        ).save()
+        # Non-ASCII names, the last one isn't in latin-1
+        for key, name in enumerate(NAMES, 4):
+            Task(
+                key=key, year=2012, org=orga, student=name, title='Task C',
+                categories=['cat_A']
+            ).save()
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.app = AsyncApp(app, db_name=TEST_DB_NAME, workers=2)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        app.config.update(self.config)
+        generation.reset()
+        self.db.drop_database(TEST_DB_NAME)
+
+    def resolved(self, result=None):
+        future = self.loop.create_future()
+        future.set_result(result)
+
+        return future
+
+    def request(self, path, query_string=b'', headers=()):
+        """Start a request of the ASGI app
+
+        :return tuple (coroutine serving the request, list of the sent
+                      messages)
+        """
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': query_string,
+            'headers': [
+                (name.encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+        }
+        messages = []
+
+        def receive():
+            return self.resolved({'type': 'http.request', 'body': b''})
+
+        def send(message):
+            messages.append(message)
+            return self.resolved()
+
+        return self.app(scope, receive, send), messages
+
+    @staticmethod
+    def response(messages):
+        """Get the response of a request from its messages
+
+        :return tuple (status code, response body, dict of headers)
+        """
+        headers = dict(
+            (name.decode('latin-1'), value.decode('latin-1'))
+            for name, value in messages[0]['headers']
+        )
+
+        return messages[0]['status'], messages[1]['body'], headers
+
+    def get(self, path, query_string=b'', headers=()):
+        """Request the ASGI app
+
+        :return tuple (status code, response body, dict of headers)
+        """
+        coroutine, messages = self.request(path, query_string, headers)
+        self.loop.run_until_complete(coroutine)
+
+        return self.response(messages)
+
+    def test_same_responses(self):
+        for path in ('/organization/all', '/organization/2012/orga',
+                     '/organization/2012/orgx', '/task/2', '/task/3',
+                     '/student/Student A/2012',
+                     '/student/Student A/2012/orgb/',
+                     '/student/Student A/2012/orgx/',
+                     u'/student/{0}/2012'.format(NAMES[0]),
+                     u'/student/{0}/2012/orga/'.format(NAMES[2])):
+            self.assertIsNotNone(self.app.match({
+                'method': 'GET', 'path': path
+            })[0])
+            status, body, _ = self.get(path)
+            rv = self.client.get(path)
+            self.assertEqual(status, rv.status_code)
+            self.assertEqual(json.loads(body.decode()),
+                             json.loads(rv.data.decode()))
+
+    def test_student_profile(self):
+        app.config['GENERATION_CHECK_INTERVAL'] = 0
+        Leaderboard.materialize(app.config['YEARS'])
+        paths = ('/student/Student A/2012', '/student/Student A/2012/orgb/',
+                 '/student/Student A/2012/orgx/', '/student/Student B/2012')
+        expected = [self.client.get(path).data for path in paths]
+
+        # The profiles are served without querying the tasks
+        Task.objects.delete()
+        for path, data in zip(paths, expected):
+            status, body, _ = self.get(path)
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body.decode()),
+                             json.loads(data.decode()), path)
+
+    def test_concurrent_requests(self):
+        # More requests than the threads wait for the database at once
+        waiting = []
+
+        def handler(db, task_id):
+            future = self.loop.create_future()
+            waiting.append((future, task_id))
+            if len(waiting) == 4:
+                for pending, key in waiting:
+                    pending.set_result({'id': key})
+            return future
+
+        handlers = dict(asgi.HANDLERS)
+        asgi.HANDLERS[TaskResource] = handler
+        try:
+            requests = [
+                self.request('/task/{0}'.format(key)) for key in range(1, 5)
+            ]
+            tasks = [
+                self.loop.create_task(coroutine) for coroutine, _ in requests
+            ]
+            done, _ = self.loop.run_until_complete(
+                asyncio.wait(tasks, timeout=10)
+            )
+        finally:
+            asgi.HANDLERS.update(handlers)
+
+        self.assertEqual(len(done), 4)
+        for key, (_, messages) in enumerate(requests, 1):
+            status, body, _ = self.response(messages)
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body.decode()), {'id': key})
+
+    def test_wsgi_fallback(self):
+        self.assertIsNone(self.app.match({
+            'method': 'GET', 'path': '/organization/2012/rank'
+        })[0])
+        status, body, _ = self.get('/task', b'year=2012&limit=1')
+        rv = self.client.get('/task?year=2012&limit=1')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, rv.data)
+
+    def test_request_pipeline(self):
+        app.config['RESPONSE_CACHE'] = True
+        path = '/organization/2012/orga'
+        origin = [('Origin', 'http://example.com')]
+        status, body, headers = self.get(path, headers=origin)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['x-cache'], 'MISS')
+
+        rv = self.client.get(path, headers=origin)
+        self.assertEqual(rv.headers['X-Cache'], 'HIT')
+        self.assertEqual(
+            rv.headers['Access-Control-Allow-Origin'],
+            headers['access-control-allow-origin']
+        )
+        self.assertEqual(rv.headers['ETag'], headers['etag'])
+        self.assertEqual(rv.data, body)
+
+        status, body, _ = self.get(
+            path, headers=[('If-None-Match', headers['etag'])]
+        )
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+        # Students are told apart by the cache keys and the ETags
+        etags = set()
+        for name in NAMES:
+            path = u'/student/{0}/2012'.format(name)
+            status, body, headers = self.get(path)
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body.decode())['student'], name)
+            etags.add(headers['etag'])
+
+            rv = self.client.get(path)
+            self.assertEqual(rv.headers['X-Cache'], 'HIT')
+            self.assertEqual(rv.data, body)
+        self.assertEqual(len(etags), len(NAMES))
+
+
+if __name__ == '__main__':
+    unittest.main()
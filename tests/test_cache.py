@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""Test response cache"""
+import logging
+import unittest
+
+import mongoengine as me
+
+from yagcil.cache import (
+    LRUCache, MemoryStore, MongoStore, ResponseCache, OrganizationCache
+)
+from yagcil.models import CachedResponse, Organization, check_indexes
+
+TEST_DB_NAME = 'yagcil-test'
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        # 'b' is the least recently used item
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_shared_tier(self):
+        shared = MemoryStore()
+        first = ResponseCache(1, shared=shared)
+        second = ResponseCache(1, shared=shared)
+
+        first.set('key', (b'body', []))
+        self.assertEqual(second.get('key'), (b'body', []))
+        self.assertIsNone(second.get('other'))
+        self.assertEqual(
+            second.stats(), {'hits': 1, 'misses': 1, 'size': 1}
+        )
+
+        first.clear()
+        self.assertIsNone(second.shared.get('key'))
+
+
+class GenerationStub(object):
+    def __init__(self, generation):
+        self.generation = generation
+
+    def current(self):
+        return self.generation
+
+
+class DatabaseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = me.connect(TEST_DB_NAME)
+        self.db.drop_database(TEST_DB_NAME)
+        check_indexes(logging.getLogger(__name__))
+
+    def tearDown(self):
+        self.db.drop_database(TEST_DB_NAME)
+
+    def test_mongo_store(self):
+        MongoStore.set('key', (b'body', [('Content-Type', 'text/plain')]))
+        self.assertEqual(
+            MongoStore.get('key'),
+            (b'body', [('Content-Type', 'text/plain')])
+        )
+        # The TTL index expires the items by the time of their creation
+        self.assertIsNotNone(CachedResponse.objects.get(key='key').created)
+
+    def test_organization_cache(self):
+        org = Organization(name='orga', full_name='Org A', year=2012).save()
+        cache = OrganizationCache(GenerationStub(1))
+        self.assertEqual(cache.get_id('orga', 2012), org.id)
+        self.assertEqual(cache.get_names([org.id]), {org.id: 'orga'})
+        self.assertIsNone(cache.get_id('orga', 2011))
+        # The organization has been loaded with the generation
+        self.assertEqual(cache.stats()['hits'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""Test Melange crawler"""
+import unittest
+import json
+import logging
+import threading
+import time
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+import mongoengine as me
+
+from yagcil import app
+from yagcil.crawler import Crawler
+from yagcil.models import (
+    DataGeneration, Organization, Task, CrawlState, check_indexes
+)
+
+TEST_DB_NAME = 'yagcil-test'
+
+
+class MelangeStub(ThreadingMixIn, HTTPServer):
+    """Local HTTP server serving Melange-shaped JSON lists
+
+    :var orgs dict Tasks served for each organization name
+    :var latency float Delay of every response (seconds)
+    :var broken set Names of the organizations responding with an error,
+                    or (name, start) of their broken pages
+    :var page_size int Number of rows in a page
+    :var requests list Requested (path, start) pairs
+    """
+    daemon_threads = True
+
+    def __init__(self, orgs, latency=0.0, broken=(), page_size=1000):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), MelangeStubHandler)
+        self.orgs = orgs
+        self.latency = latency
+        self.broken = set(broken)
+        self.page_size = page_size
+        self.requests = []
+
+    @property
+    def urls(self):
+        root = 'http://127.0.0.1:{port}'.format(port=self.server_address[1])
+        return {
+            'ORGS': root + '/gci{year}',
+            'TASKS': root + '/gci{year}/{orgname}'
+        }
+
+
+class MelangeStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        start = parse_qs(url.query).get('start', [''])[0]
+        self.server.requests.append((url.path, start))
+        parts = url.path.strip('/').split('/')
+        if len(parts) == 1:
+            rows = [
+                {'columns': {'org_id': name, 'name': name.upper()}}
+                for name in sorted(self.server.orgs)
+            ]
+        elif (parts[1] in self.server.broken or
+                (parts[1], start) in self.server.broken):
+            self.send_error(500)
+            return
+        else:
+            rows = [
+                {'columns': task} for task in self.server.orgs[parts[1]]
+            ]
+
+        offset = int(start or 0)
+        end = offset + self.server.page_size
+        body = json.dumps({
+            'data': {start: rows[offset:end]},
+            'next': str(end) if end < len(rows) else 'done'
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CrawlerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = me.connect(TEST_DB_NAME)
+        self.db.drop_database(TEST_DB_NAME)
+        self.logger = logging.getLogger(__name__)
+        check_indexes(self.logger)
+        self.years = app.config['YEARS']
+        app.config['YEARS'] = [2012]
+
+        orgs = {}
+        for i in range(10):
+            orgs['org{0}'.format(i)] = [{
+                'key': i * 100 + j,
+                'student': 'Student {0}'.format(j),
+                'title': 'Task {0}'.format(j),
+                'types': 'Code, Documentation'
+            } for j in range(5)]
+        self.orgs = orgs
+
+    def tearDown(self):
+        app.config['YEARS'] = self.years
+        self.db.drop_database(TEST_DB_NAME)
+
+    def __crawl(self, jobs, latency=0.0, broken=(), page_size=1000,
+                incremental=False):
+        """Crawl the stub server
+
+        :return tuple (crawler, elapsed time, requested (path, start))
+        """
+        server = MelangeStub(self.orgs, latency, broken, page_size)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            crawler = Crawler(
+                self.logger, jobs=jobs, retries=1, backoff=0,
+                urls=server.urls, incremental=incremental
+            )
+            start = time.time()
+            crawler.fetch_active_year()
+            elapsed = time.time() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        return crawler, elapsed, server.requests
+
+    def test_fetch(self):
+        crawler, _, _ = self.__crawl(jobs=4)
+        self.assertEqual(crawler.failed, [])
+        self.assertEqual(Organization.objects(year=2012).count(), 10)
+        self.assertEqual(Task.objects(year=2012).count(), 50)
+        task = Task.objects.get(key=301)
+        self.assertEqual(task.org.name, 'org3')
+        self.assertEqual(task.categories, ['Code', 'Documentation'])
+
+    def test_ingest_stats(self):
+        crawler, _, _ = self.__crawl(jobs=4)
+        self.assertEqual(crawler.stats['orgs'].inserted, 10)
+        self.assertEqual(crawler.stats['tasks'].inserted, 50)
+
+        self.orgs['org3'][1]['title'] = 'Changed title'
+        self.orgs['org3'][2]['student'] = 'Student X'
+        crawler, _, _ = self.__crawl(jobs=4)
+        self.assertEqual(crawler.stats['orgs'].unchanged, 10)
+        stats = crawler.stats['tasks']
+        self.assertEqual(
+            (stats.inserted, stats.updated, stats.unchanged), (0, 2, 48)
+        )
+        self.assertEqual(Task.objects.get(key=301).title, 'Changed title')
+        self.assertEqual(Task.objects.get(key=302).student, 'Student X')
+        self.assertEqual(Organization.objects(year=2012).count(), 10)
+
+    def test_concurrent_speedup(self):
+        _, sequential, _ = self.__crawl(jobs=1, latency=0.1)
+        self.db.drop_database(TEST_DB_NAME)
+        _, concurrent, _ = self.__crawl(jobs=10, latency=0.1)
+
+        logging.getLogger(__name__).info(
+            'Sequential: %.2fs, concurrent: %.2fs', sequential, concurrent
+        )
+        self.assertLess(concurrent, sequential / 2)
+        self.assertEqual(Task.objects(year=2012).count(), 50)
+
+    def test_failed_org(self):
+        crawler, _, _ = self.__crawl(jobs=4, broken=['org5'])
+        self.assertEqual(crawler.failed, [(2012, 'org5')])
+        self.assertEqual(Task.objects(year=2012).count(), 45)
+
+    def test_pagination(self):
+        crawler, _, requests = self.__crawl(jobs=1, page_size=2)
+        self.assertEqual(crawler.failed, [])
+        self.assertEqual(Task.objects(year=2012).count(), 50)
+        self.assertIn(('/gci2012/org3', '4'), requests)
+
+    def test_incremental(self):
+        crawler, _, _ = self.__crawl(jobs=4, page_size=2, incremental=True)
+        self.assertEqual(crawler.stats['tasks'].inserted, 50)
+        self.assertTrue(crawler.changed)
+        state = CrawlState.objects.get(year=2012, org_name='org3')
+        self.assertEqual(len(state.page_hashes), 3)
+        self.assertIsNone(state.cursor)
+
+        # Only the changed page is written
+        self.orgs['org3'][3]['title'] = 'Changed title'
+        crawler, _, _ = self.__crawl(jobs=4, page_size=2, incremental=True)
+        stats = crawler.stats['tasks']
+        self.assertEqual((stats.inserted, stats.updated), (0, 1))
+        self.assertEqual(stats.unchanged, 49)
+        self.assertEqual(Task.objects.get(key=303).title, 'Changed title')
+
+        crawler, _, _ = self.__crawl(jobs=4, page_size=2, incremental=True)
+        self.assertFalse(crawler.changed)
+
+    def test_incremental_unpublished(self):
+        crawler, _, _ = self.__crawl(jobs=1, incremental=True)
+        crawler.materialize()
+        crawler, _, _ = self.__crawl(jobs=1, incremental=True)
+        self.assertFalse(crawler.unpublished)
+
+        # The crawl which has written the change dies before publishing it
+        self.orgs['org3'][3]['title'] = 'Changed title'
+        crawler, _, _ = self.__crawl(jobs=1, incremental=True)
+        self.assertTrue(crawler.changed)
+
+        crawler, _, _ = self.__crawl(jobs=1, incremental=True)
+        self.assertFalse(crawler.changed)
+        self.assertTrue(crawler.unpublished)
+        crawler.materialize()
+        self.assertFalse(DataGeneration.unpublished())
+
+    def test_incremental_resume(self):
+        self.orgs['org3'][4]['title'] = 'Changed title'
+        crawler, _, _ = self.__crawl(
+            jobs=1, page_size=2, incremental=True, broken=[('org3', '4')]
+        )
+        self.assertEqual(crawler.failed, [(2012, 'org3')])
+        state = CrawlState.objects.get(year=2012, org_name='org3')
+        self.assertEqual(state.cursor, '4')
+        self.assertEqual(len(state.pending_hashes), 2)
+
+        crawler, _, requests = self.__crawl(
+            jobs=1, page_size=2, incremental=True
+        )
+        org_requests = [x for x in requests if x[0] == '/gci2012/org3']
+        self.assertEqual(org_requests, [('/gci2012/org3', '4')])
+        self.assertEqual(Task.objects.get(key=304).title, 'Changed title')
+        state.reload()
+        self.assertIsNone(state.cursor)
+        self.assertEqual(len(state.page_hashes), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,24 @@
 #!/usr/bin/env python
 """Test API Server resources"""
 import unittest
+import gzip
 import json
+import logging
+import random
+from io import BytesIO
+from operator import itemgetter
 
 import mongoengine as me
 
 from yagcil import app
-from yagcil.models import Organization, Task
+from yagcil.cache import generation, response_cache, organizations
+from yagcil.metrics import registry
+from yagcil.snapshot import snapshots
+from yagcil.helpers import tasks_to_dict, queryset_to_dict, output_json
+from yagcil.models import (
+    Organization, Task, DataGeneration, Leaderboard, StudentProfile,
+    check_indexes
+)
 
 TEST_DB_NAME = 'yagcil-test'
 
@@ -17,6 +29,7 @@ class YagcilTestCase(unittest.TestCase):
         self.db = me.connect(TEST_DB_NAME)
         # Reset the database
         self.db.drop_database(TEST_DB_NAME)
+        check_indexes(logging.getLogger(__name__))
         # Add few test entries to the database
         orgs = [
             Organization(name='orga', full_name='Org A', year=2012),
@@ -66,6 +79,12 @@ class YagcilTestCase(unittest.TestCase):
         self.__setupDatabase()
         self.years = app.config['YEARS'] = [2011, 2012]
         self.active_year = max(self.years)
+        app.config['GENERATION_CHECK_INTERVAL'] = 0
+        generation.reset()
+        response_cache.clear()
+        organizations.clear()
+        snapshots.snapshot = None
+        registry.clear()
 
         self.app = app.test_client()
 
@@ -91,6 +110,26 @@ class YagcilTestCase(unittest.TestCase):
                 self.tasks_added[category + str(year)]
             )
 
+    def test_count_categories(self):
+        self.assertDictEqual(
+            Task.count_categories(2012),
+            {'cat_A': 2, 'cat_B': 1}
+        )
+        self.assertDictEqual(
+            Task.count_categories(2012, org_name='orga'),
+            {'cat_A': 1}
+        )
+        # Filters are combined instead of being replaced by the org filter
+        self.assertDictEqual(
+            Task.count_categories(2012, org_name='orgb', student='Student A'),
+            {}
+        )
+        self.assertDictEqual(
+            Task.count_categories(2011, org_name='orga'),
+            {}
+        )
+        self.assertEqual(Task.count_categories(2012, org_name='none'), [])
+
     def test_organization_rank(self):
         rv = self.app.get('/organization/2012/orga/rank')
         rank = json.loads(rv.data.decode())
@@ -104,10 +143,293 @@ class YagcilTestCase(unittest.TestCase):
         self.assertEqual(rank[1]['student'], 'Student B')
         self.assertEqual(rank[1]['tasks'], self.tasks_added['st_B'])
 
+    def test_organization_rank_partial(self):
+        orgs = Organization.objects(year=2012)
+        Task.objects.insert([
+            Task(
+                key=100 + i, year=2012, org=orgs[i % 2],
+                student='Student {0}'.format(i % 20), title='Task'
+            ) for i in range(210)
+        ], load_bulk=False)
+        rv = self.app.get('/organization/2012/rank')
+        full = json.loads(rv.data.decode())
+        rv = self.app.get('/organization/2012/orgb/rank')
+        full_orgb = json.loads(rv.data.decode())
+
+        def check():
+            rv = self.app.get('/organization/2012/rank?limit=5')
+            self.assertEqual(json.loads(rv.data.decode()), full[:5])
+
+            for i in (0, 1, 10, len(full) - 1):
+                rv = self.app.get(
+                    '/organization/2012/rank?student={0}'.format(
+                        full[i]['student']
+                    )
+                )
+                rank = json.loads(rv.data.decode())
+                start = max(i - 2, 0)
+                self.assertEqual(
+                    [x['position'] for x in rank],
+                    list(range(start + 1, min(i + 3, len(full)) + 1))
+                )
+                self.assertEqual(
+                    [x['student'] for x in rank],
+                    [x['student'] for x in full[start:i + 3]]
+                )
+
+            rv = self.app.get(
+                '/organization/2012/orgb/rank?neighbours=0&student=' +
+                full_orgb[3]['student']
+            )
+            self.assertEqual(
+                json.loads(rv.data.decode()), [dict(full_orgb[3], position=4)]
+            )
+            for url in ('/organization/2012/rank?student=Nobody',
+                        '/organization/2012/none/rank?student=Student 1'):
+                rv = self.app.get(url)
+                self.assertEqual(json.loads(rv.data.decode()), [])
+
+        check()
+        Leaderboard.materialize(self.years)
+        check()
+        app.config['SNAPSHOT_ENGINE'] = True
+        try:
+            response_cache.clear()
+            snapshots.reload()
+            check()
+        finally:
+            app.config['SNAPSHOT_ENGINE'] = False
+
+    def test_organization_rank_large(self):
+        """Compare the rank with the naive implementation on 100k tasks"""
+        rnd = random.Random(2012)
+        orgs = Organization.objects(year=2012)
+        students = ['Student {0}'.format(i) for i in range(500)]
+        Task.objects.insert([
+            Task(
+                key=1000 + i, year=2012, org=rnd.choice(orgs),
+                student=rnd.choice(students), title='Task {0}'.format(i)
+            ) for i in range(100000)
+        ], load_bulk=False)
+
+        for url, tasks in (
+            ('/organization/2012/rank', Task.objects(year=2012)),
+            ('/organization/2012/orgb/rank', Task.objects(org=orgs[1]))
+        ):
+            # The original list.count based implementation
+            tasks_students = [x.student for x in tasks.only('student')]
+            expected = [
+                {'student': student, 'tasks': tasks_students.count(student)}
+                for student in sorted(set(tasks_students))
+            ]
+            expected = sorted(expected, key=itemgetter('tasks'), reverse=True)
+
+            rv = self.app.get(url)
+            rank = json.loads(rv.data.decode())
+            self.assertEqual(rank, expected)
+
+    @staticmethod
+    def __plan_stages(plan):
+        """Get all stages of a query plan"""
+        stages = [plan.get('stage')]
+        for child in plan.get('inputStages', []) + [plan.get('inputStage')]:
+            if child is not None:
+                stages.extend(YagcilTestCase.__plan_stages(child))
+
+        return stages
+
+    def test_indexes(self):
+        """Every query used by the resources is served by an index"""
+        self.assertDictEqual(
+            check_indexes(logging.getLogger(__name__), build=False), {}
+        )
+
+        org = Organization.objects.get(name='orga', year=2012)
+        queries = [
+            Organization.objects(name='orga', year=2012),
+            Organization.objects(year=2012),
+            Task.objects(year=2012),
+            Task.objects(org=org),
+            Task.objects(year=2012, org=org),
+            Task.objects(student='Student A', year=2012),
+            Task.objects(year=2012, org=org, student='Student A')
+        ]
+        for query in queries:
+            plan = query.explain()['queryPlanner']['winningPlan']
+            stages = self.__plan_stages(plan)
+            self.assertIn('IXSCAN', stages)
+            self.assertNotIn('COLLSCAN', stages)
+
+    def test_materialized_leaderboards(self):
+        urls = [
+            '/organization/2012/rank', '/organization/2012/orga/rank',
+            '/organization/2012/stats', '/organization/2012/orgb/stats'
+        ]
+        live = [json.loads(self.app.get(url).data.decode()) for url in urls]
+
+        for generation in (1, 2, 3):
+            self.assertEqual(Leaderboard.materialize(self.years), generation)
+        self.assertEqual(DataGeneration.current().generation, 3)
+        # Only the current and the previous generations are kept
+        self.assertEqual(Leaderboard.objects(generation=1).count(), 0)
+        self.assertEqual(
+            Leaderboard.objects(generation=3).count(),
+            Leaderboard.objects(generation=2).count()
+        )
+
+        # Leaderboards are served without touching the tasks
+        Task.objects.delete()
+        materialized = [
+            json.loads(self.app.get(url).data.decode()) for url in urls
+        ]
+        self.assertEqual(materialized, live)
+
+    def test_response_cache(self):
+        url = '/organization/2012/rank'
+        rv = self.app.get(url)
+        self.assertEqual(rv.headers['X-Cache'], 'MISS')
+        rank = json.loads(rv.data.decode())
+
+        # The data changes only with a new generation
+        Task.objects(student='Student A').delete()
+        rv = self.app.get(url)
+        self.assertEqual(rv.headers['X-Cache'], 'HIT')
+        self.assertEqual(json.loads(rv.data.decode()), rank)
+        # Arguments are a part of the key
+        for url_args, status in (('1', 'MISS'), ('2', 'MISS'), ('1', 'HIT')):
+            rv = self.app.get('/task?limit=' + url_args)
+            self.assertEqual(rv.headers['X-Cache'], status)
+
+        Leaderboard.materialize(self.years)
+        rv = self.app.get(url)
+        self.assertEqual(rv.headers['X-Cache'], 'MISS')
+        rank = json.loads(rv.data.decode())
+        self.assertEqual(rank, [{'student': 'Student B', 'tasks': 1}])
+
+        self.assertEqual(
+            response_cache.stats(), {'hits': 2, 'misses': 4, 'size': 4}
+        )
+
+    def test_conditional_requests(self):
+        url = '/organization/2012/rank'
+        rv = self.app.get(url)
+        etag = rv.headers['ETag']
+        self.assertNotIn('Last-Modified', rv.headers)
+
+        rv = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(rv.status_code, 304)
+        self.assertEqual(rv.data, b'')
+        # 304 is returned without running the resource
+        self.assertEqual(response_cache.stats()['hits'], 0)
+
+        rv = self.app.get('/task', headers={'If-None-Match': etag})
+        self.assertEqual(rv.status_code, 200)
+
+        Leaderboard.materialize(self.years)
+        rv = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(rv.status_code, 200)
+        self.assertNotEqual(rv.headers['ETag'], etag)
+        last_modified = rv.headers['Last-Modified']
+
+        rv = self.app.get(url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(rv.status_code, 304)
+        rv = self.app.get(url, headers={
+            'If-Modified-Since': 'Mon, 01 Dec 2014 00:00:00 GMT'
+        })
+        self.assertEqual(rv.status_code, 200)
+
+    def test_snapshot_engine(self):
+        urls = [
+            '/organization/2012/rank', '/organization/2012/orga/rank',
+            '/organization/2012/none/rank', '/organization/2011/rank',
+            '/organization/2012/stats', '/organization/2012/orgb/stats',
+            '/organization/2012/none/stats',
+            '/task', '/task?org=orga', '/task?org=none',
+            '/task?student=Student A', '/task?student=Student A&org=orgb',
+            '/task?year=2011', '/task?limit=1&offset=1',
+            '/task?stream=true&offset=1',
+            '/student/Student A/2012', '/student/Student A/2012/orga/',
+            '/student/Student A/2012/none/'
+        ]
+        # The student ranks are served from the materialized profiles
+        Leaderboard.materialize(self.years)
+        expected = [self.app.get(url).data.decode() for url in urls]
+
+        app.config['SNAPSHOT_ENGINE'] = True
+        try:
+            response_cache.clear()
+            snapshot = snapshots.reload()
+            self.assertIs(snapshots.get(), snapshot)
+            self.assertEqual(snapshots.stats()['tasks'], 3)
+            self.assertGreater(snapshots.stats()['bytes'], 0)
+            # Tasks are mapped to their organizations by the ids
+            self.assertNotIn(-1, list(snapshot.task_orgs))
+
+            for url, data in zip(urls, expected):
+                self.assertEqual(
+                    json.loads(self.app.get(url).data.decode()),
+                    json.loads(data), url
+                )
+
+            rv = self.app.get('/task?limit=1')
+            rv = self.app.get(
+                '/task?cursor=' + rv.headers['X-Next-Cursor']
+            )
+            ids = [x['id'] for x in json.loads(rv.data.decode())]
+            self.assertEqual(ids, [2, 3])
+
+            # Stale snapshot isn't served
+            Leaderboard.materialize(self.years)
+            self.assertIsNot(snapshots.get(), snapshot)
+        finally:
+            app.config['SNAPSHOT_ENGINE'] = False
+
     def test_all_organization_list(self):
         rv = self.app.get('/organization/all')
         orgs = json.loads(rv.data.decode())
         self.assertEqual(len(orgs), 2)
+        for item in orgs:
+            rv = self.app.get('/organization?year={0}'.format(item['year']))
+            self.assertEqual(item['orgs'], json.loads(rv.data.decode()))
+
+    def test_all_years_rank_and_stats(self):
+        orga = Organization.objects.get(name='orga', year=2011)
+        Task(
+            key=4, year=2011, org=orga, student='Student B', title='Task D',
+            categories=['cat_C']
+        ).save()
+
+        rv = self.app.get('/organization/all/rank')
+        self.assertEqual(json.loads(rv.data.decode()), [
+            {'student': 'Student A', 'tasks': 2,
+             'years': [{'year': 2012, 'tasks': 2}]},
+            {'student': 'Student B', 'tasks': 2,
+             'years': [{'year': 2011, 'tasks': 1}, {'year': 2012, 'tasks': 1}]}
+        ])
+        rv = self.app.get('/organization/all/orga/rank')
+        rank = json.loads(rv.data.decode())
+        self.assertEqual(
+            [(x['student'], x['tasks']) for x in rank],
+            [('Student A', 2), ('Student B', 1)]
+        )
+        rv = self.app.get('/organization/all/none/rank')
+        self.assertEqual(json.loads(rv.data.decode()), [])
+
+        rv = self.app.get('/organization/all/stats')
+        self.assertEqual(json.loads(rv.data.decode()), {
+            'categories': {'cat_A': 2, 'cat_B': 1, 'cat_C': 1},
+            'years': [
+                {'year': 2011, 'categories': {'cat_C': 1}},
+                {'year': 2012, 'categories': {'cat_A': 2, 'cat_B': 1}}
+            ]
+        })
+        rv = self.app.get('/organization/all/orga/stats')
+        stats = json.loads(rv.data.decode())
+        self.assertEqual(stats['categories'], {'cat_A': 1, 'cat_C': 1})
+        rv = self.app.get('/organization/all/none/stats')
+        self.assertEqual(
+            json.loads(rv.data.decode()), {'categories': {}, 'years': []}
+        )
 
     def test_organization(self):
         rv = self.app.get('/organization/2011/orgc')
@@ -142,6 +464,77 @@ class YagcilTestCase(unittest.TestCase):
         tasks = json.loads(rv.data.decode())
         self.assertEqual(len(tasks), self.tasks_added['st_A'])
 
+    def test_task_list_cursor(self):
+        keys = []
+        url = '/task?limit=1'
+        while url:
+            rv = self.app.get(url)
+            tasks = json.loads(rv.data.decode())
+            keys.extend(task['id'] for task in tasks)
+            cursor = rv.headers.get('X-Next-Cursor')
+            url = '/task?limit=1&cursor=' + cursor if cursor else None
+
+        self.assertEqual(keys, [1, 2, 3])
+
+        # Offset is still supported, the cursor follows the returned page
+        rv = self.app.get('/task?limit=1&offset=1')
+        self.assertEqual(json.loads(rv.data.decode())[0]['id'], 2)
+        self.assertIn('cursor=', rv.headers['Link'])
+        self.assertNotIn('offset=', rv.headers['Link'])
+        rv = self.app.get('/task?cursor=' + rv.headers['X-Next-Cursor'])
+        self.assertEqual([x['id'] for x in json.loads(rv.data.decode())], [3])
+
+        rv = self.app.get('/task?cursor=invalid')
+        self.assertEqual(rv.status_code, 400)
+
+    def test_task_list_max_limit(self):
+        app.config['TASK_LIST_MAX_LIMIT'] = 2
+        try:
+            for url in ('/task', '/task?limit=5'):
+                rv = self.app.get(url)
+                self.assertEqual(len(json.loads(rv.data.decode())), 2)
+                self.assertIn('X-Next-Cursor', rv.headers)
+        finally:
+            app.config['TASK_LIST_MAX_LIMIT'] = 1000
+
+    def test_task_list_stream(self):
+        app.config['TASK_LIST_MAX_LIMIT'] = 1
+        try:
+            rv = self.app.get('/task?stream=true')
+        finally:
+            app.config['TASK_LIST_MAX_LIMIT'] = 1000
+        # The streamed list isn't limited
+        tasks = json.loads(rv.data.decode())
+        self.assertEqual([task['id'] for task in tasks], [1, 2, 3])
+        self.assertEqual(tasks[1]['orgName'], 'orgb')
+
+        rv = self.app.get(
+            '/task?student=Student A',
+            headers={'Accept': 'application/x-ndjson'}
+        )
+        self.assertEqual(rv.mimetype, 'application/x-ndjson')
+        lines = rv.data.decode().splitlines()
+        self.assertEqual([json.loads(x)['id'] for x in lines], [1, 3])
+
+        rv = self.app.get('/task?year=2011&stream=true')
+        self.assertEqual(json.loads(rv.data.decode()), [])
+
+        rv = self.app.get('/organization?year=2011&stream=true')
+        self.assertEqual(len(json.loads(rv.data.decode())), 3)
+
+    def test_raw_serialization(self):
+        """The raw path returns the same data as the models' to_dict"""
+        tasks = Task.objects.order_by('key')
+        self.assertEqual(
+            tasks_to_dict(tasks), [task.to_dict() for task in tasks]
+        )
+        self.assertEqual(tasks_to_dict(tasks)[2]['categories'], [])
+
+        orgs = Organization.objects(year=2011)
+        self.assertEqual(
+            queryset_to_dict(orgs), [org.to_dict() for org in orgs]
+        )
+
     def test_task(self):
         rv = self.app.get('/task/2')
         task = json.loads(rv.data.decode())
@@ -152,13 +545,260 @@ class YagcilTestCase(unittest.TestCase):
         self.assertEqual(task['year'], 2012)
         self.assertEqual(task['orgName'], 'orgb')
 
-    # TODO(poxip): Write tests for StudentResource
+    def __count_queries(self, url, collection):
+        """Count queries issued against a collection while getting an url"""
+        db = self.db[TEST_DB_NAME]
+        db.set_profiling_level(0)
+        db.system.profile.drop()
+        db.set_profiling_level(2)
+        try:
+            rv = self.app.get(url)
+        finally:
+            db.set_profiling_level(0)
+
+        namespace = '{0}.{1}'.format(TEST_DB_NAME, collection)
+        queries = db.system.profile.find({'ns': namespace}).count()
+
+        return rv, queries
+
+    def test_task_list_org_queries(self):
+        """Organizations are resolved with a constant number of queries"""
+        orgs = Organization.objects(year=2012)
+        Task.objects.insert([
+            Task(
+                key=1000 + i, year=2012, org=orgs[i % 2],
+                student='Student C', title='Task {0}'.format(i)
+            ) for i in range(1000)
+        ], load_bulk=False)
+
+        rv, queries = self.__count_queries(
+            '/task?year=2012&limit=1000', 'organization'
+        )
+        tasks = json.loads(rv.data.decode())
+        self.assertEqual(len(tasks), 1000)
+        self.assertLessEqual(queries, 1)
+        self.assertEqual(
+            set(task['orgName'] for task in tasks), {'orga', 'orgb'}
+        )
+
+        rv, queries = self.__count_queries(
+            '/student/Student C/2012', 'organization'
+        )
+        student = json.loads(rv.data.decode())
+        self.assertEqual(len(student['tasks']), 1000)
+        self.assertLessEqual(queries, 1)
+
+    def test_organization_cache(self):
+        urls = [
+            '/organization/2012/orga/rank', '/organization/2012/orgb/stats',
+            '/task?org=orga', '/student/Student A/2012/orga/', '/task/2'
+        ]
+        for url in urls:
+            self.app.get(url)
+        self.assertEqual(organizations.stats()['misses'], 0)
+        self.assertEqual(organizations.stats()['size'], 5)
+
+        response_cache.clear()
+        for url in urls:
+            rv, queries = self.__count_queries(url, 'organization')
+            self.assertEqual(rv.status_code, 200)
+            self.assertEqual(queries, 0, url)
+
+        # A new generation reloads the organizations
+        Organization(name='orge', full_name='Org E', year=2012).save()
+        Leaderboard.materialize(self.years)
+        rv = self.app.get('/task?org=orge')
+        self.assertEqual(json.loads(rv.data.decode()), [])
+        self.assertEqual(organizations.stats()['size'], 6)
+        self.assertEqual(organizations.stats()['misses'], 0)
+
+    def test_student(self):
+        rv = self.app.get('/student/Student B/2012')
+        student = json.loads(rv.data.decode())
+        self.assertEqual([task['id'] for task in student['tasks']], [2])
+        # The rank is unknown until the profiles are materialized
+        self.assertEqual(student['stats'], {
+            'categories': {'cat_A': 1, 'cat_B': 1},
+            'rank': None
+        })
+
+        Leaderboard.materialize(self.years)
+        rv = self.app.get('/student/Student B/2012')
+        self.assertEqual(json.loads(rv.data.decode())['stats']['rank'], 2)
+        rv = self.app.get('/student/Student B/2012/orgb/')
+        self.assertEqual(json.loads(rv.data.decode())['stats']['rank'], 1)
+        rv = self.app.get('/student/Student B/2012/orga/')
+        self.assertEqual(json.loads(rv.data.decode()), {
+            'student': 'Student B',
+            'tasks': [],
+            'stats': {'categories': {}, 'rank': None}
+        })
+
+    def test_student_profiles(self):
+        urls = [
+            '/student/Student A/2012', '/student/Student A/2012/orga/',
+            '/student/Student A/2012/orgb/', '/student/Student A/2012/none/',
+            '/student/Student B/2012', '/student/Student C/2012',
+            '/student/Student A/2011'
+        ]
+        live = [json.loads(self.app.get(url).data.decode()) for url in urls]
+
+        Leaderboard.materialize(self.years)
+        self.assertEqual(StudentProfile.objects.count(), 2)
+        # Profiles are served without touching the tasks
+        Task.objects.delete()
+        response_cache.clear()
+        for url, expected in zip(urls, live):
+            rv, queries = self.__count_queries(url, 'task')
+            profile = json.loads(rv.data.decode())
+            if expected:
+                # Only the profiles know the rank
+                self.assertIsNone(expected['stats'].pop('rank'))
+                profile['stats'].pop('rank')
+            self.assertEqual(profile, expected, url)
+            self.assertEqual(queries, 0)
+        rv = self.app.get('/student/Student A/2012/orgb/')
+        self.assertIsNone(json.loads(rv.data.decode())['stats']['rank'])
+        rv = self.app.get('/student/Student A/2012')
+        self.assertEqual(json.loads(rv.data.decode())['stats']['rank'], 1)
+
+    def test_batch(self):
+        urls = [
+            '/config', '/organization/2012/rank',
+            '/task?student=Student A&year=2012',
+            '/task?year=2012&student=Student A',
+            '/task/10', '/batch'
+        ]
+        for parallel in (False, True):
+            response_cache.clear()
+            rv = self.app.post('/batch', data=json.dumps({
+                'requests': urls, 'parallel': parallel
+            }), content_type='application/json')
+            self.assertEqual(rv.status_code, 200)
+            responses = json.loads(rv.data.decode())['responses']
+
+            self.assertEqual([x['path'] for x in responses], urls)
+            self.assertEqual(
+                [x['status'] for x in responses],
+                [200, 200, 200, 200, 404, 400]
+            )
+            self.assertEqual(
+                responses[0]['body'],
+                json.loads(self.app.get('/config').data.decode())
+            )
+            self.assertEqual(len(responses[2]['body']), 2)
+            self.assertEqual(responses[2]['body'], responses[3]['body'])
+            # Identical sub-requests are executed once
+            self.assertEqual(response_cache.stats()['misses'], 4)
+
+        rv = self.app.post('/batch', data=json.dumps({'requests': '/'}))
+        self.assertEqual(rv.status_code, 400)
+        rv = self.app.post('/batch', data=json.dumps({
+            'requests': ['/config'] * 100
+        }))
+        self.assertEqual(rv.status_code, 400)
 
     def test_root(self):
         rv = self.app.get('/')
         root = json.loads(rv.data.decode())
         self.assertGreater(len(root), 0)
 
+        server = app.config['SERVER_URL']
+        self.assertEqual(root['taskUrl'], server + '/task/{id}')
+        self.assertEqual(
+            root['organizationRankUrl'],
+            server + '/organization/{year}{/name}/rank'
+            '{?limit,student,neighbours}'
+        )
+        self.assertEqual(
+            root['studentUrl'], server + '/student/{name}/{year}{/org_name}'
+        )
+        self.assertEqual(
+            root['organizationListUrl'], server + '/organization{?year}'
+        )
+        self.assertEqual(root['configUrl'], server + '/config')
+        self.assertEqual(
+            root['organizationUrl'], server + '/organization/{year}{/name}'
+        )
+
+        rv = self.app.get('/?listType=angular-resource')
+        root = json.loads(rv.data.decode())
+        self.assertEqual(
+            root['studentUrl'], server + '/student/:name/:year/:org_name'
+        )
+        self.assertEqual(root['taskListUrl'], server + '/task')
+
+    def test_precomputed_headers(self):
+        for url in ('/', '/config'):
+            rv = self.app.get(url)
+            self.assertIn('max-age', rv.headers['Cache-Control'])
+            etag = rv.headers['ETag']
+            rv = self.app.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(rv.status_code, 304)
+
+    def test_metrics(self):
+        self.app.get('/organization/2012/rank')
+        rv = self.app.get('/metrics')
+        self.assertEqual(rv.status_code, 200)
+        metrics = dict(
+            line.rsplit(' ', 1) for line in rv.data.decode().splitlines()
+            if not line.startswith('#')
+        )
+        endpoint = '{endpoint="organizationrankresource"}'
+        self.assertEqual(metrics['yagcil_requests_total' + endpoint], '1')
+        self.assertGreater(
+            int(metrics['yagcil_mongo_commands_total' + endpoint]), 0
+        )
+        self.assertIn(
+            'yagcil_serialization_duration_seconds_count' + endpoint, metrics
+        )
+        self.assertEqual(metrics['yagcil_response_cache_misses'], '1')
+
+    def test_profile(self):
+        app.config['PROFILER_ENABLED'] = True
+        rv = self.app.get('/organization/2012/rank?__profile=1')
+        self.assertEqual(rv.mimetype, 'text/plain')
+        self.assertIn('function calls', rv.data.decode())
+
+        app.config['PROFILER_ENABLED'] = False
+        rv = self.app.get('/organization/2012/rank?__profile=1')
+        self.assertEqual(rv.mimetype, 'application/json')
+
+    def test_compression(self):
+        orgs = Organization.objects(year=2012)
+        Task.objects.insert([
+            Task(
+                key=100 + i, year=2012, org=orgs[i % 2],
+                student='Student C', title='Task {0}'.format(i)
+            ) for i in range(100)
+        ], load_bulk=False)
+        url = '/task?year=2012'
+        data = self.app.get(url).data
+        self.assertGreater(len(data), app.config['COMPRESSION_MIN_SIZE'])
+
+        rv = self.app.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(rv.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', rv.headers['Vary'])
+        self.assertEqual(gzip.GzipFile(fileobj=BytesIO(rv.data)).read(), data)
+        # Compressed responses are validated by their weak ETags
+        rv = self.app.get(url, headers={'If-None-Match': rv.headers['ETag']})
+        self.assertEqual(rv.status_code, 304)
+
+        # Small responses aren't compressed
+        rv = self.app.get('/task/1', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', rv.headers)
+
+    def test_output_json(self):
+        with app.test_request_context():
+            rv = output_json({'a': [1, 2]}, 200, {'X-Test': '1'})
+            self.assertEqual(json.loads(rv.get_data().decode()), {'a': [1, 2]})
+            self.assertEqual(rv.headers['X-Test'], '1')
+            # Pre-encoded documents aren't encoded again
+            rv = output_json(b'{"a": 1}', 201)
+            self.assertEqual(rv.get_data(), b'{"a": 1}')
+            self.assertEqual(rv.status_code, 201)
+            self.assertEqual(rv.mimetype, 'application/json')
+
     def test_config(self):
         rv = self.app.get('/config')
         config = json.loads(rv.data.decode())
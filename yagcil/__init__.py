@@ -4,11 +4,14 @@ from flask import Flask, jsonify
 from flask.ext import restful
 from flask.ext.cors import CORS
 
+from yagcil import metrics
 from yagcil.errorhandlers import AbstractError
+from yagcil.helpers import output_json, compress_response
 
 app = Flask(__name__)
 cors = CORS(app)
 api = restful.Api(app)
+api.representation('application/json')(output_json)
 
 if os.environ.get('DEBUG', 'true').lower() == 'false':
     app.config.from_object('yagcil.config.production')
@@ -35,4 +38,33 @@ def handle_api_error(error):
     return response
 
 
+app.after_request(compress_response)
+
+from yagcil.cache import cached, conditional, response_cache, organizations
+# The last decorator is the outermost one
+api.decorators.extend([cached, conditional, metrics.profiled])
+
 import yagcil.resources
+from yagcil.snapshot import snapshots
+
+metrics.init_app(app, api)
+metrics.registry.gauge(
+    'yagcil_response_cache_hits', 'Response cache hits',
+    lambda: response_cache.hits
+)
+metrics.registry.gauge(
+    'yagcil_response_cache_misses', 'Response cache misses',
+    lambda: response_cache.misses
+)
+metrics.registry.gauge(
+    'yagcil_organization_cache_hits', 'Organizations resolved from the cache',
+    lambda: organizations.hits
+)
+metrics.registry.gauge(
+    'yagcil_organization_cache_misses', 'Organizations queried',
+    lambda: organizations.misses
+)
+metrics.registry.gauge(
+    'yagcil_snapshot_bytes', 'Memory footprint of the snapshot',
+    lambda: snapshots.stats()['bytes']
+)
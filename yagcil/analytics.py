@@ -0,0 +1,89 @@
+"""
+    Vectorized leaderboard and category statistics
+
+    Students, organizations and categories are encoded as integer codes
+    (see yagcil.snapshot), so the statistics are computed with NumPy
+    instead of per-row Python loops. NumPy is optional, check
+    analytics.available before using the module.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+available = np is not None
+
+
+def as_codes(values):
+    """View integer codes (e.g., array('i')) as a NumPy array
+
+    :param values Buffer of 32-bit integers
+    :return ndarray Array sharing the memory with the buffer
+    """
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int32)
+
+    return np.frombuffer(values, dtype=np.int32)
+
+
+def name_ranks(names):
+    """Get positions of names in the sorted order
+
+    :param names list Names indexed by their codes
+    :return ndarray Position of each code's name when sorted by the name
+    """
+    order = sorted(range(len(names)), key=names.__getitem__)
+    ranks = np.empty(len(names), dtype=np.int64)
+    ranks[order] = np.arange(len(names))
+
+    return ranks
+
+
+def rank(students, ranks):
+    """Rank students by the number of their tasks
+
+    Ties are broken by the student's name, the same as Task.rank().
+
+    :param students ndarray Student code of each task
+    :param ranks ndarray Name positions of the codes (see name_ranks)
+    :return tuple (student codes, task counts) sorted by the rank
+    """
+    counts = np.bincount(students, minlength=len(ranks))
+    codes = np.flatnonzero(counts)
+    order = np.lexsort((ranks[codes], -counts[codes]))
+
+    return codes[order], counts[codes][order]
+
+
+def gather(offsets, values, rows):
+    """Gather variable-length values (e.g., categories) of rows
+
+    :param offsets ndarray Start of each row's values, with the end of
+                           the last row appended
+    :param values ndarray Values of all the rows
+    :param rows ndarray Rows to gather
+    :return ndarray Concatenated values of the rows
+    """
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    total = lengths.sum()
+    if total == 0:
+        return np.zeros(0, dtype=values.dtype)
+
+    # Index of every gathered value: its row's start plus its position
+    shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+
+    return values[shifts + np.arange(total)]
+
+
+def histogram(codes, size):
+    """Count occurrences of the codes
+
+    :param codes ndarray Codes to count
+    :param size int Number of all the codes
+    :return tuple (codes, counts) of the codes occurring at least once
+    """
+    counts = np.bincount(codes, minlength=size)
+    present = np.flatnonzero(counts)
+
+    return present, counts[present]
@@ -0,0 +1,473 @@
+"""
+    ASGI serving mode
+
+    Resources whose queries are independent are served by coroutines
+    using the motor async MongoDB driver, their queries run concurrently.
+    The coroutines replace only the resources' queries, the response
+    cache, conditional requests, metrics, compression and CORS are
+    applied by the app the same as to the WSGI requests. Those steps run
+    in a thread pool, but no thread waits for the queries. All the other
+    requests are handed to the WSGI app in a thread pool, so the resource
+    routes stay the same. Requires Python 3.5+ and motor
+    (requirements-asgi.txt).
+"""
+import asyncio
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from werkzeug.exceptions import HTTPException
+
+from yagcil import app, api
+from yagcil.cache import (
+    generation, cache_enabled, cached_response, cache_response, validators,
+    not_modified_response, validated
+)
+from yagcil.errorhandlers import ResourceNotFound, ErrorCode
+from yagcil.metrics import current_measurements
+from yagcil.models import (
+    Organization, Task, StudentProfile, raw_to_dict, api_field_names,
+    organizations_by_year_pipeline
+)
+from yagcil.resources import (
+    AllOrganizationListResource, OrganizationResource, TaskResource,
+    StudentResource
+)
+
+
+def db_field(document_class, name):
+    """Get the MongoDB name of a model's field"""
+    return document_class._fields[name].db_field
+
+
+def projection(document_class):
+    """Get the projection of the fields used by the API representation"""
+    return dict(
+        (db_field(document_class, name), 1)
+        for name in api_field_names(document_class)
+    )
+
+
+def collection(db, document_class):
+    return db[document_class._get_collection_name()]
+
+
+async def find(db, document_class, query, sort=None):
+    """Find raw documents with the fields of the API representation
+
+    :return list Raw documents
+    """
+    cursor = collection(db, document_class).find(
+        query, projection(document_class)
+    )
+    if sort is not None:
+        cursor = cursor.sort(sort, 1)
+
+    return await cursor.to_list(None)
+
+
+async def all_organizations(db):
+    """AllOrganizationListResource, all years are queried at once"""
+    years = list(app.config['YEARS'])
+    groups = await collection(db, Organization).aggregate(
+        organizations_by_year_pipeline(years)
+    ).to_list(None)
+    orgs = dict(
+        (group['_id'], [
+            raw_to_dict(Organization, raw) for raw in group['orgs']
+        ])
+        for group in groups
+    )
+
+    return [{'year': year, 'orgs': orgs.get(year, [])} for year in years]
+
+
+async def organization(db, name, year):
+    """OrganizationResource"""
+    raw = await collection(db, Organization).find_one({
+        db_field(Organization, 'name'): name,
+        db_field(Organization, 'year'): year
+    }, projection(Organization))
+    if raw is None:
+        return []
+
+    return raw_to_dict(Organization, raw)
+
+
+async def task(db, task_id):
+    """TaskResource"""
+    raw = await collection(db, Task).find_one(
+        {db_field(Task, 'key'): task_id}, projection(Task)
+    )
+    if raw is None:
+        raise ResourceNotFound('Task not found', ErrorCode.TaskNotFound)
+
+    org_id = raw.get(db_field(Task, 'org'))
+    org = await collection(db, Organization).find_one(
+        {'_id': org_id}, {db_field(Organization, 'name'): 1}
+    )
+    org_names = {}
+    if org is not None:
+        org_names[org_id] = org[db_field(Organization, 'name')]
+
+    return raw_to_dict(Task, raw, org_names)
+
+
+async def student_profile(db, name, year, org_name=None):
+    """Serialize the student's profile of the current data generation
+
+    :return dict|list|None Serialized profile, None if the profiles
+                           haven't been materialized
+    """
+    # Refreshed by the response cache decorators of the request already
+    current = generation.current()
+    if not current:
+        return None
+
+    raw = await collection(db, StudentProfile).find_one({
+        db_field(StudentProfile, 'generation'): current,
+        db_field(StudentProfile, 'student'): name,
+        db_field(StudentProfile, 'year'): year
+    })
+    if raw is None:
+        profile = StudentProfile(
+            generation=current, student=name, year=year
+        )
+    else:
+        profile = StudentProfile._from_son(raw)
+
+    known_org = org_name is None or any(
+        org['name'] == org_name for org in profile.orgs
+    )
+    if not known_org:
+        org = await collection(db, Organization).find_one({
+            db_field(Organization, 'name'): org_name,
+            db_field(Organization, 'year'): year
+        }, {'_id': 1})
+        if org is None:
+            return []
+
+    return profile.to_dict(org_name)
+
+
+async def student(db, name, year, org_name=None):
+    """StudentResource
+
+    The student's profile of the current data generation is served if
+    it's been materialized. Otherwise the student's tasks and the
+    organizations of the year (for their names) are queried
+    concurrently. The org filter and the categories are then applied to
+    the loaded tasks. The rank position is None without the profiles,
+    the same as in StudentResource.
+    """
+    profile = await student_profile(db, name, year, org_name)
+    if profile is not None:
+        return profile
+
+    tasks, orgs = await asyncio.gather(
+        find(db, Task, {
+            db_field(Task, 'student'): name,
+            db_field(Task, 'year'): year
+        }, sort=db_field(Task, 'key')),
+        collection(db, Organization).find(
+            {db_field(Organization, 'year'): year},
+            {db_field(Organization, 'name'): 1}
+        ).to_list(None)
+    )
+    org_names = dict(
+        (org['_id'], org[db_field(Organization, 'name')]) for org in orgs
+    )
+
+    if org_name is not None:
+        org_ids = [
+            org_id for org_id, org in org_names.items() if org == org_name
+        ]
+        if not org_ids:
+            return []
+
+        tasks = [
+            raw for raw in tasks if raw.get(db_field(Task, 'org')) in org_ids
+        ]
+
+    categories = Counter(
+        category
+        for raw in tasks
+        for category in raw.get(db_field(Task, 'categories')) or ()
+    )
+
+    return {
+        'student': name,
+        'tasks': [raw_to_dict(Task, raw, org_names) for raw in tasks],
+        'stats': {
+            'categories': dict(categories),
+            'rank': None
+        }
+    }
+
+
+# Coroutines serving resources, keyed by the resource class
+HANDLERS = {
+    AllOrganizationListResource: all_organizations,
+    OrganizationResource: organization,
+    TaskResource: task,
+    StudentResource: student
+}
+
+
+def latin1(path):
+    """Convert a decoded path to a WSGI string of its UTF-8 bytes"""
+    return path.encode('utf-8').decode('latin-1')
+
+
+def wsgi_environ(scope, body):
+    """Build a WSGI environment of an ASGI HTTP request"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # WSGI strings hold the raw bytes, the ASGI path is decoded
+        'SCRIPT_NAME': latin1(scope.get('root_path', '')),
+        'PATH_INFO': latin1(scope['path']),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = 'HTTP_' + name
+            if key in environ:
+                value = environ[key] + ',' + value
+            environ[key] = value
+
+    return environ
+
+
+def call_wsgi(wsgi_app, environ):
+    """Call a WSGI app
+
+    Streamed responses are buffered.
+
+    :return tuple (status code, list of headers, body)
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+    return response['status'], response['headers'], body
+
+
+class AsyncApp(object):
+    """ASGI app serving the API"""
+
+    def __init__(self, wsgi_app, db_name=None, workers=None):
+        """Initialize the app
+
+        :param wsgi_app callable WSGI app serving the other requests
+        :param db_name str MongoDB database (default: MONGODB_DB_NAME)
+        :param workers int Threads running the WSGI app
+        (default: ASGI_WSGI_WORKERS config)
+        """
+        self.wsgi_app = wsgi_app
+        self.db_name = db_name or app.config['MONGODB_DB_NAME']
+        self.executor = ThreadPoolExecutor(
+            workers or app.config['ASGI_WSGI_WORKERS']
+        )
+        self.client = None
+
+    @property
+    def db(self):
+        # The client is bound to the event loop it's first used in
+        if self.client is None:
+            self.client = AsyncIOMotorClient(
+                host=app.config.get('MONGODB_DB_HOST'),
+                port=app.config.get('MONGODB_DB_PORT'),
+                username=app.config.get('MONGODB_DB_USERNAME'),
+                password=app.config.get('MONGODB_DB_PASSWORD')
+            )
+
+        return self.client[self.db_name]
+
+    def match(self, scope):
+        """Find the coroutine serving a request
+
+        :return tuple (coroutine, view arguments) or (None, None)
+        """
+        # The snapshot engine serves the data from memory without I/O
+        if scope['method'] != 'GET' or app.config.get('SNAPSHOT_ENGINE'):
+            return None, None
+
+        # Profiled requests run the resource itself
+        if b'__profile=' in scope.get('query_string', b''):
+            return None, None
+
+        adapter = app.url_map.bind(app.config.get('SERVER_NAME') or '')
+        try:
+            endpoint, view_args = adapter.match(scope['path'], 'GET')
+        except HTTPException:
+            return None, None
+
+        view_class = getattr(
+            app.view_functions.get(endpoint), 'view_class', None
+        )
+        handler = HANDLERS.get(view_class)
+        if handler is None:
+            return None, None
+
+        return handler, view_args
+
+    @staticmethod
+    def before(environ):
+        """Process a request up to its resource, in the thread pool
+
+        The same steps as the app's before-request hooks and the API
+        decorators, so a cached response or a 304 is returned without
+        running the coroutine.
+
+        :return tuple (status code, list of headers, body) or None if
+                      the coroutine has to run, and the request's state
+                      passed to after()
+        """
+        with app.request_context(environ):
+            try:
+                response = app.preprocess_request()
+                if response is None:
+                    etag, last_modified = validators()
+                    response = not_modified_response(etag, last_modified)
+                    if response is None and cache_enabled():
+                        response = cached_response(etag)
+                        if response is not None:
+                            response = validated(
+                                response, etag, last_modified
+                            )
+            except Exception as error:
+                response = app.handle_user_exception(error)
+
+            if response is not None:
+                response = app.process_response(app.make_response(response))
+                return call_wsgi(response, environ), None
+
+            # The request's measurement is recorded by after()
+            measurements = current_measurements()[-1:]
+            return None, (measurements, etag, last_modified)
+
+    @staticmethod
+    def after(environ, state, data, error):
+        """Build the response of the coroutine, in the thread pool
+
+        :param state tuple The request's state returned by before()
+        :param data Data returned by the coroutine
+        :param error Exception|None Exception raised by the coroutine
+        :return tuple (status code, list of headers, body)
+        """
+        measurements, etag, last_modified = state
+        with app.request_context(environ):
+            current_measurements().extend(measurements)
+            try:
+                if error is not None:
+                    raise error
+                response = api.make_response(data, 200)
+                if cache_enabled():
+                    response = cache_response(etag, response)
+                response = validated(response, etag, last_modified)
+            except Exception as exception:
+                response = app.handle_user_exception(exception)
+            response = app.process_response(app.make_response(response))
+
+            return call_wsgi(response, environ)
+
+    async def dispatch(self, environ, handler, view_args):
+        """Serve a request by a coroutine in the app's request pipeline
+
+        Only the steps before and after the coroutine run in the thread
+        pool, no thread is held while the coroutine waits for MongoDB.
+
+        :return tuple (status code, list of headers, body)
+        """
+        loop = asyncio.get_event_loop()
+        result, state = await loop.run_in_executor(
+            self.executor, self.before, environ
+        )
+        if result is not None:
+            return result
+
+        data = error = None
+        try:
+            data = await handler(self.db, **view_args)
+        except Exception as exception:
+            error = exception
+
+        return await loop.run_in_executor(
+            self.executor, self.after, environ, state, data, error
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        environ = wsgi_environ(scope, body)
+        handler, view_args = self.match(scope)
+        if handler is not None:
+            status, headers, body = await self.dispatch(
+                environ, handler, view_args
+            )
+        else:
+            loop = asyncio.get_event_loop()
+            status, headers, body = await loop.run_in_executor(
+                self.executor, call_wsgi, self.wsgi_app, environ
+            )
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.client is not None:
+                    self.client.close()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = AsyncApp(app)
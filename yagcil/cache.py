@@ -0,0 +1,508 @@
+"""
+    Response cache and conditional requests
+
+    GET responses are cached by the endpoint, its arguments and the data
+    generation. The generation is bumped by update_db.py after every
+    crawl, so the cached responses are never stale. The same key is used
+    as the responses' ETag.
+
+    Organization ids and names are cached for the current generation too.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+
+from flask import request
+
+from yagcil import app
+from yagcil.helpers import wants_ndjson
+from yagcil.models import DataGeneration, CachedResponse, Organization
+
+
+class GenerationWatcher(object):
+    """Current data generation, read at most once per interval
+
+    The interval is set by GENERATION_CHECK_INTERVAL config (seconds).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked_at = None
+        self.generation = 0
+        self.updated_at = None
+
+    def __refresh(self):
+        """Read the current generation if the interval has passed"""
+        interval = app.config.get('GENERATION_CHECK_INTERVAL', 5)
+        now = time.time()
+        if self.checked_at is not None and now - self.checked_at < interval:
+            return
+
+        current = DataGeneration.current()
+        with self.lock:
+            self.checked_at = now
+            if current is None:
+                self.generation, self.updated_at = 0, None
+            else:
+                self.generation = current.generation
+                self.updated_at = current.updated_at
+
+    def current(self):
+        """Get the current data generation
+
+        :return int Number of the current generation, 0 if there is none
+        """
+        self.__refresh()
+
+        return self.generation
+
+    def last_modified(self):
+        """Get the time when the current generation has been published
+
+        :return datetime|None Time of the publication
+        """
+        self.__refresh()
+
+        return self.updated_at
+
+    def reset(self):
+        """Force reading the generation on the next call"""
+        with self.lock:
+            self.checked_at = None
+
+
+class LRUCache(object):
+    """Thread-safe in-process LRU cache"""
+
+    def __init__(self, size):
+        """Initialize the cache
+
+        :param size int Maximum number of the cached items
+        """
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Get an item, None if it's not cached"""
+        with self.lock:
+            value = self.items.pop(key, None)
+            if value is not None:
+                self.items[key] = value
+
+        return value
+
+    def set(self, key, value):
+        """Cache an item, evicting the least recently used one"""
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = value
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class MemoryStore(object):
+    """Shared cache tier stand-in keeping the items in a dictionary"""
+
+    def __init__(self):
+        self.items = {}
+
+    def get(self, key):
+        return self.items.get(key)
+
+    def set(self, key, value):
+        self.items[key] = value
+
+    def clear(self):
+        self.items.clear()
+
+
+class MongoStore(object):
+    """Shared cache tier storing the items in MongoDB
+
+    The items are shared by all the server processes.
+    """
+
+    @staticmethod
+    def get(key):
+        cached = CachedResponse.objects(key=key).first()
+        if cached is None:
+            return None
+
+        return bytes(cached.body), [tuple(x) for x in cached.headers]
+
+    @staticmethod
+    def set(key, value):
+        body, headers = value
+        CachedResponse.objects(key=key).update_one(
+            set__body=body,
+            set__headers=[list(x) for x in headers],
+            # Expires the item by the TTL index
+            set__created=datetime.utcnow(),
+            upsert=True
+        )
+
+    @staticmethod
+    def clear():
+        CachedResponse.objects.delete()
+
+
+class ResponseCache(object):
+    """Two-tier cache of (body, headers) responses
+
+    :var hits int Number of the requests served from the cache
+    :var misses int Number of the requests which weren't cached
+    """
+
+    def __init__(self, size, shared=None):
+        """Initialize the cache
+
+        :param size int Size of the in-process LRU tier
+        :param shared Optional shared tier, e.g., MongoStore
+        """
+        self.local = LRUCache(size)
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Get a cached response, None if it's not cached"""
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    def set(self, key, value):
+        """Cache a response in all the tiers"""
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def clear(self):
+        """Remove all cached responses and reset the counters"""
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Get the cache counters
+
+        :return dict Hits, misses and the size of the local tier
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.local)
+        }
+
+
+class OrganizationCache(object):
+    """Organization ids and names of the current data generation
+
+    All organizations are loaded at once and reloaded with every new
+    generation, so resolving them doesn't need any queries. Organizations
+    added since are loaded on a miss.
+
+    :var hits int Number of the organizations resolved from the cache
+    :var misses int Number of the organizations which had to be queried
+    """
+
+    def __init__(self, watcher):
+        """Initialize the cache
+
+        :param watcher GenerationWatcher Current data generation
+        """
+        self.watcher = watcher
+        self.lock = threading.Lock()
+        self.generation = None
+        self.ids = {}
+        self.names = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __refresh(self):
+        """Load all the organizations if the generation has changed"""
+        current = self.watcher.current()
+        if current == self.generation:
+            return
+
+        ids = {}
+        names = {}
+        # The id has to be listed, as_pymongo() leaves it out otherwise
+        orgs = Organization.objects.only('id', 'name', 'year')
+        for org in orgs.as_pymongo():
+            ids[(org['year'], org['name'])] = org['_id']
+            names[org['_id']] = org['name']
+
+        with self.lock:
+            self.ids, self.names = ids, names
+            self.generation = current
+
+    def get_id(self, name, year):
+        """Get the id of an organization
+
+        :param name str Organization's name
+        :param year int GCI year
+        :return ObjectId|None The id, None if the organization doesn't
+                              exist
+        """
+        self.__refresh()
+        org_id = self.ids.get((year, name))
+        if org_id is not None:
+            self.hits += 1
+            return org_id
+
+        self.misses += 1
+        org = Organization.objects(name=name, year=year).only('id').first()
+        if org is None:
+            # Unknown names aren't cached, they come from the URLs
+            return None
+
+        with self.lock:
+            self.ids[(year, name)] = org.id
+            self.names[org.id] = name
+
+        return org.id
+
+    def get_names(self, org_ids):
+        """Get names of organizations
+
+        :param org_ids iterable Organization ids
+        :return dict Names keyed by the ids, unknown ids are left out
+        """
+        self.__refresh()
+        names = {}
+        missing = []
+        for org_id in set(org_ids):
+            name = self.names.get(org_id)
+            if name is not None:
+                names[org_id] = name
+            elif org_id is not None:
+                missing.append(org_id)
+
+        self.hits += len(names)
+        if missing:
+            self.misses += len(missing)
+            orgs = list(Organization.objects(id__in=missing).only('name'))
+            with self.lock:
+                for org in orgs:
+                    names[org.id] = self.names[org.id] = org.name
+
+        return names
+
+    def clear(self):
+        """Remove all the organizations and reset the counters"""
+        with self.lock:
+            self.ids, self.names = {}, {}
+            self.generation = None
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Get the cache counters
+
+        :return dict Hits, misses and the number of the organizations
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.names)
+        }
+
+
+SHARED_STORES = {
+    'memory': MemoryStore,
+    'mongo': MongoStore
+}
+
+generation = GenerationWatcher()
+organizations = OrganizationCache(generation)
+response_cache = ResponseCache(
+    app.config.get('RESPONSE_CACHE_SIZE', 1024),
+    shared=SHARED_STORES[app.config['RESPONSE_CACHE_SHARED']]()
+    if app.config.get('RESPONSE_CACHE_SHARED') else None
+)
+
+
+def request_key():
+    """Get a key identifying the request and the current data generation
+
+    :return str Cache key
+    """
+    args = sorted(request.args.items(multi=True))
+    view_args = sorted((request.view_args or {}).items())
+    key = repr((
+        generation.current(), request.endpoint, view_args, args,
+        wants_ndjson()
+    ))
+
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def cache_enabled():
+    """Whether the response of the request can be cached"""
+    return request.method == 'GET' and app.config.get('RESPONSE_CACHE')
+
+
+def cached_response(key):
+    """Get a cached response
+
+    :param key str Cache key of the request, see request_key()
+    :return Response|None The response, None if it isn't cached
+    """
+    value = response_cache.get(key)
+    if value is None:
+        return None
+
+    body, headers = value
+    response = app.response_class(body, headers=headers)
+    response.headers['X-Cache'] = 'HIT'
+
+    return response
+
+
+def cache_response(key, response):
+    """Cache a successful response
+
+    :param key str Cache key of the request, see request_key()
+    :param response Response The response of a view
+    :return Response The response
+    """
+    if response.status_code == 200 and not response.is_streamed:
+        response_cache.set(key, (
+            response.get_data(), list(response.headers.items())
+        ))
+    response.headers['X-Cache'] = 'MISS'
+
+    return response
+
+
+def cached(view):
+    """Serve GET responses of a view from the response cache"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not cache_enabled():
+            return view(*args, **kwargs)
+
+        key = request_key()
+        response = cached_response(key)
+        if response is None:
+            response = cache_response(key, view(*args, **kwargs))
+
+        return response
+
+    return wrapper
+
+
+def validators():
+    """Get the validators of the request's response
+
+    ETag is derived from the request and the data generation and
+    Last-Modified is the time of the last crawl.
+
+    :return tuple (ETag, Last-Modified datetime or None)
+    """
+    last_modified = generation.last_modified()
+    if last_modified is not None:
+        # HTTP dates have a one second precision
+        last_modified = last_modified.replace(microsecond=0)
+
+    return request_key(), last_modified
+
+
+def not_modified_response(etag, last_modified):
+    """Answer a conditional request without running the view
+
+    :param etag str ETag of the request's response
+    :param last_modified datetime|None Last-Modified of the response
+    :return Response|None A 304 response, None if the client's copy
+                          isn't current
+    """
+    if request.if_none_match:
+        # Compressed responses have weak ETags
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = (
+            request.if_modified_since is not None and
+            last_modified is not None and
+            last_modified <= request.if_modified_since
+        )
+
+    if not not_modified:
+        return None
+
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    return response
+
+
+def validated(response, etag, last_modified):
+    """Set the validators of a view's response
+
+    :param response Response The response of the view
+    :param etag str ETag of the request's response
+    :param last_modified datetime|None Last-Modified of the response
+    :return Response The response, a 304 if the resource validates its
+                     responses itself and the client's copy is current
+    """
+    if response.status_code != 200:
+        return response
+
+    own_etag, _ = response.get_etag()
+    if own_etag is not None:
+        # The resource validates its responses itself
+        if request.if_none_match.contains_weak(own_etag):
+            response = app.response_class(status=304)
+            response.set_etag(own_etag)
+        return response
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    return response
+
+
+def conditional(view):
+    """Answer conditional GET requests of a view
+
+    A 304 is returned without running the view, see validators().
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+
+        etag, last_modified = validators()
+        response = not_modified_response(etag, last_modified)
+        if response is None:
+            response = validated(view(*args, **kwargs), etag, last_modified)
+
+        return response
+
+    return wrapper
@@ -14,3 +14,31 @@ MONGODB_DB_USERNAME = os.environ.get('OPENSHIFT_MONGODB_DB_USERNAME')
 MONGODB_DB_PASSWORD = os.environ.get('OPENSHIFT_MONGODB_DB_PASSWORD')
 
 YEARS = [2014, 2013, 2012]
+
+# Maximum number of tasks returned by the task list
+TASK_LIST_MAX_LIMIT = 1000
+
+# Batch endpoint limits
+BATCH_MAX_REQUESTS = 50
+BATCH_WORKERS = 4
+
+# Threads serving the WSGI app in the ASGI mode (asgi.py)
+ASGI_WSGI_WORKERS = 8
+
+# Response cache
+RESPONSE_CACHE = True
+RESPONSE_CACHE_SIZE = 1024
+# Optional shared cache tier: None, 'memory' or 'mongo'
+RESPONSE_CACHE_SHARED = 'mongo'
+# How often the data generation is checked (seconds)
+GENERATION_CHECK_INTERVAL = 5
+
+# Serve the read API from an in-memory snapshot of the data
+SNAPSHOT_ENGINE = False
+
+# Allow ?__profile=1 to return cProfile output of a request
+PROFILER_ENABLED = False
+
+# Compress responses of at least COMPRESSION_MIN_SIZE bytes (gzip or brotli)
+COMPRESSION = True
+COMPRESSION_MIN_SIZE = 1024
@@ -0,0 +1,350 @@
+"""
+    Google Melange crawler
+"""
+import json
+import hashlib
+import threading
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+
+import requests
+from pymongo import UpdateOne
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from yagcil import app
+from yagcil.models import (
+    Task, Organization, Leaderboard, CrawlState, DataGeneration
+)
+
+
+class IngestStats(object):
+    """Number of records written by a bulk ingestion"""
+
+    def __init__(self, inserted=0, updated=0, unchanged=0):
+        self.inserted = inserted
+        self.updated = updated
+        self.unchanged = unchanged
+
+    def add(self, other):
+        """Add counts of another ingestion
+
+        :param other IngestStats Counts to add
+        """
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+
+    @staticmethod
+    def bulk_upsert(document, operations):
+        """Write upserts with an unordered bulk write
+
+        :param document type Document class to write to
+        :param operations list A list of UpdateOne upserts
+        :return IngestStats Counts of the written records
+        """
+        if not operations:
+            return IngestStats()
+
+        result = document._get_collection().bulk_write(
+            operations, ordered=False
+        )
+
+        return IngestStats(
+            inserted=result.upserted_count,
+            updated=result.modified_count,
+            unchanged=result.matched_count - result.modified_count
+        )
+
+    def __str__(self):
+        return '{0} inserted, {1} updated, {2} unchanged'.format(
+            self.inserted, self.updated, self.unchanged
+        )
+
+
+class Crawler(object):
+    """Crawl closed tasks from Google Melange
+
+    Tasks of the organizations are fetched concurrently by a pool of
+    workers sharing one keep-alive HTTP session.
+
+    In the incremental mode pages whose payload hasn't changed since the
+    last crawl are not written, and each fetched page is checkpointed so
+    an interrupted crawl resumes from the next page.
+    """
+    URLS = {
+        'TASKS': 'http://www.google-melange.com/gci/org/google/'
+                 'gci{year}/{orgname}?fmt=json&limit=1000&idx=1',
+        'ORGS': 'https://www.google-melange.com/gci/org/'
+                'list/public/google/gci{year}?fmt=json'
+    }
+
+    def __init__(self, logger, jobs=1, retries=3, backoff=0.5, timeout=30,
+                 urls=None, incremental=False):
+        """Initialize the crawler
+
+        :param logger Logger Logger to report the progress to
+        :param jobs int Number of organizations fetched concurrently
+        :param retries int Number of retries of a failed request
+        :param backoff float Backoff factor between the retries (seconds)
+        :param timeout float Request timeout (seconds)
+        :param urls dict URLs overriding the default Melange ones
+        :param incremental bool Whether the incremental mode is enabled
+        """
+        self.years = sorted(app.config['YEARS'])
+        self.active_year = max(self.years)
+        self.archive_years = [x for x in self.years if x != self.active_year]
+
+        self.logger = logger
+        self.jobs = max(1, jobs)
+        self.timeout = timeout
+        self.urls = dict(self.URLS, **(urls or {}))
+        self.incremental = incremental
+        # Organizations which couldn't be fetched, as (year, name)
+        self.failed = []
+        # Whether the data change has been recorded, see __mark_changed()
+        self.marked = False
+        self.lock = threading.Lock()
+        self.stats = {
+            'orgs': IngestStats(),
+            'tasks': IngestStats()
+        }
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_maxsize=self.jobs,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff,
+                status_forcelist=[500, 502, 503, 504]
+            )
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def changed(self):
+        """Whether the crawl has changed any data"""
+        return any(
+            stats.inserted or stats.updated for stats in self.stats.values()
+        )
+
+    @property
+    def unpublished(self):
+        """Whether the data has changed since the last published generation
+
+        Changes written by an earlier crawl which hasn't published them
+        (e.g., it has died) are included.
+        """
+        return self.changed or DataGeneration.unpublished()
+
+    def __mark_changed(self):
+        """Record a data change before writing it (once per crawl)"""
+        with self.lock:
+            if not self.marked:
+                DataGeneration.mark_changed()
+                self.marked = True
+
+    def __get_page(self, url, start=''):
+        """Fetch a page of Melange JSON list data
+
+        :param url str URL of the list
+        :param start str Start key of the page, '' for the first page
+        :return tuple (rows, next start key or None on the last page)
+        """
+        self.logger.debug('Fetching %s (start: %r)', url, start)
+        r = self.session.get(
+            url, params={'start': start} if start else None,
+            timeout=self.timeout
+        )
+        r.raise_for_status()
+
+        data = json.loads(r.text)
+        rows = data.get('data').get(start) or []
+        next_start = data.get('next')
+        if not rows or next_start in (None, '', 'done', start):
+            next_start = None
+
+        return rows, next_start
+
+    def __get_all_pages(self, url):
+        """Fetch all pages of Melange JSON list data
+
+        :param url str URL of the list
+        :return list Fetched list rows
+        """
+        rows, start = self.__get_page(url)
+        while start is not None:
+            page, start = self.__get_page(url, start)
+            rows.extend(page)
+
+        return rows
+
+    @staticmethod
+    def __ingest_tasks(org, year, fetched_tasks):
+        """Upsert fetched tasks
+
+        :param org Organization Organization of the tasks
+        :param year int GCI year
+        :param fetched_tasks list Melange rows of the tasks
+        :return IngestStats Counts of the written tasks
+        """
+        operations = []
+        for fetched_task in fetched_tasks:
+            fetched_task = fetched_task.get('columns')
+            operations.append(UpdateOne(
+                {'_id': fetched_task.get('key')},
+                {'$set': {
+                    'year': year,
+                    'org': org.id,
+                    'student': fetched_task.get('student'),
+                    'title': fetched_task.get('title'),
+                    'categories': fetched_task.get('types').split(', ')
+                }},
+                upsert=True
+            ))
+
+        return IngestStats.bulk_upsert(Task, operations)
+
+    def __fetch_org_tasks_by_year(self, org, year):
+        url = self.urls['TASKS'].format(orgname=org.name, year=year)
+        self.logger.info('Getting %d/%s', year, org.name)
+
+        state = None
+        start = ''
+        if self.incremental:
+            state = CrawlState.objects(year=year, org_name=org.name).first()
+            if state is None:
+                state = CrawlState(year=year, org_name=org.name)
+            if state.cursor is not None:
+                start = state.cursor
+                self.logger.info(
+                    'Resuming %d/%s from %r', year, org.name, start
+                )
+            else:
+                state.pending_hashes = []
+
+        stats = IngestStats()
+        while True:
+            fetched_tasks, next_start = self.__get_page(url, start)
+            self.logger.info('Got %d tasks', len(fetched_tasks))
+            if state is None:
+                stats.add(self.__ingest_tasks(org, year, fetched_tasks))
+            else:
+                page = len(state.pending_hashes)
+                page_hash = hashlib.sha1(json.dumps(
+                    fetched_tasks, sort_keys=True
+                ).encode('utf-8')).hexdigest()
+                state.pending_hashes.append(page_hash)
+                if (page < len(state.page_hashes) and
+                        state.page_hashes[page] == page_hash):
+                    stats.unchanged += len(fetched_tasks)
+                else:
+                    self.__mark_changed()
+                    stats.add(self.__ingest_tasks(org, year, fetched_tasks))
+
+            if next_start is None:
+                break
+
+            start = next_start
+            if state is not None:
+                # Checkpoint: the pages before the cursor are stored
+                state.cursor = start
+                state.save()
+
+        if state is not None:
+            state.page_hashes = state.pending_hashes
+            state.pending_hashes = []
+            state.cursor = None
+            state.content_hash = hashlib.sha1(
+                ''.join(state.page_hashes).encode('utf-8')
+            ).hexdigest()
+            state.fetched_at = datetime.utcnow()
+            state.save()
+
+        self.logger.info('Tasks of %d/%s: %s', year, org.name, stats)
+
+        return stats
+
+    def __try_fetch_org_tasks_by_year(self, args):
+        """Fetch tasks of an organization, logging failures
+
+        :param args tuple (org, year) to fetch
+        :return IngestStats|None Ingested tasks, None on failure
+        """
+        org, year = args
+        try:
+            return self.__fetch_org_tasks_by_year(org, year)
+        except Exception:
+            self.logger.exception('Failed to get %d/%s', year, org.name)
+            self.failed.append((year, org.name))
+
+    def __fetch_year(self, year):
+        """Fetch specified year"""
+        # Get all the organizations from this year
+        url = self.urls['ORGS'].format(year=year)
+        self.logger.info('Getting list of the organizations for %d', year)
+
+        fetched_orgs = [
+            fetched_org.get('columns')
+            for fetched_org in self.__get_all_pages(url)
+        ]
+        self.logger.info('Got %d organizations', len(fetched_orgs))
+        if self.incremental:
+            stored = set(
+                (org.name, org.full_name)
+                for org in Organization.objects(year=year)
+            )
+            fetched = set(
+                (x.get('org_id'), x.get('name')) for x in fetched_orgs
+            )
+            if fetched - stored:
+                self.__mark_changed()
+
+        stats = IngestStats.bulk_upsert(Organization, [
+            UpdateOne(
+                {'year': year, 'name': fetched_org.get('org_id')},
+                {'$set': {'full_name': fetched_org.get('name')}},
+                upsert=True
+            ) for fetched_org in fetched_orgs
+        ])
+        self.logger.info('Organizations of %d: %s', year, stats)
+        self.stats['orgs'].add(stats)
+
+        orgs = [
+            (org, year) for org in Organization.objects(
+                year=year,
+                name__in=[x.get('org_id') for x in fetched_orgs]
+            )
+        ]
+        if self.jobs == 1:
+            results = [self.__try_fetch_org_tasks_by_year(x) for x in orgs]
+        else:
+            pool = ThreadPool(self.jobs)
+            try:
+                results = pool.map(self.__try_fetch_org_tasks_by_year, orgs)
+            finally:
+                pool.close()
+                pool.join()
+
+        for stats in results:
+            if stats is not None:
+                self.stats['tasks'].add(stats)
+
+    def fetch_active_year(self):
+        """Fetch active year"""
+        self.__fetch_year(self.active_year)
+
+    def fetch_archive(self):
+        """Fetch archive years"""
+        for year in self.archive_years:
+            self.__fetch_year(year)
+
+    def fetch_all(self):
+        self.fetch_archive()
+        self.fetch_active_year()
+
+    def materialize(self):
+        """Publish precomputed leaderboards of the fetched data"""
+        generation = Leaderboard.materialize(self.years)
+        self.logger.info('Published data generation %d', generation)
@@ -10,6 +10,9 @@ class ErrorCode(IntEnum):
     # ResourceNotFound
     TaskNotFound = 10
     OrgNotFound = 11
+    # BadRequest
+    InvalidCursor = 20
+    InvalidBatch = 21
 
 
 class AbstractError(Exception):
@@ -51,3 +54,7 @@ class AbstractError(Exception):
 
 class ResourceNotFound(AbstractError):
     status_code = 404
+
+
+class BadRequest(AbstractError):
+    status_code = 400
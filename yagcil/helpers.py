@@ -1,4 +1,57 @@
 """Some useful functions"""
+import base64
+import gzip
+import hashlib
+import json
+from io import BytesIO
+
+from flask import Response, current_app, request, stream_with_context
+
+from yagcil.models import Task, raw_to_dict, api_field_names
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+try:
+    string_types = (basestring,)
+except NameError:
+    string_types = (str,)
+
+# The fastest available JSON encoder, the json module is the fallback
+try:
+    import orjson
+
+    def _fast_dumps(data):
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    try:
+        import ujson
+
+        def _fast_dumps(data):
+            return ujson.dumps(
+                data, ensure_ascii=False, escape_forward_slashes=False
+            ).encode('utf-8')
+    except ImportError:
+        _fast_dumps = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def iter_queryset_dict(queryset):
+    """Serialize MongoEngine QuerySet lazily
+
+    Only the serialized fields are fetched and the raw documents are
+    serialized without building model instances.
+
+    :param queryset QuerySet A QuerySet to convert
+    :return generator Serialized documents
+    """
+    document_class = queryset._document
+    rows = queryset.no_cache().only(*api_field_names(document_class))
+    for row in rows.as_pymongo():
+        yield raw_to_dict(document_class, row)
 
 
 def queryset_to_dict(queryset):
@@ -7,8 +60,219 @@ def queryset_to_dict(queryset):
     :param queryset QuerySet A QuerySet to convert
     :return dict Dictionary filled with QuerySet's data
     """
-    result = []
-    for item in queryset:
-        result.append(item.to_dict())
+    return list(iter_queryset_dict(queryset))
+
+
+def _batch_to_dict(rows):
+    """Convert a batch of raw Tasks, resolving their organizations at once
+
+    :param rows list Raw tasks to convert
+    :return list A list of serialized tasks
+    """
+    # yagcil.cache depends on this module
+    from yagcil.cache import organizations
+    org_names = organizations.get_names(row.get('org') for row in rows)
+
+    return [raw_to_dict(Task, row, org_names) for row in rows]
+
+
+def iter_tasks_dict(tasks, batch_size=1000):
+    """Serialize Tasks lazily
+
+    Only the serialized fields are fetched and the raw documents are
+    serialized without building model instances. Organizations referenced
+    by the tasks are fetched with a single query per batch instead of
+    being dereferenced one by one.
+
+    :param tasks QuerySet Tasks to convert
+    :param batch_size int Number of tasks sharing an organizations query
+    :return generator Serialized tasks
+    """
+    batch = []
+    for row in tasks.no_cache().only(*api_field_names(Task)).as_pymongo():
+        batch.append(row)
+        if len(batch) == batch_size:
+            for item in _batch_to_dict(batch):
+                yield item
+            batch = []
+
+    for item in _batch_to_dict(batch):
+        yield item
+
+
+def tasks_to_dict(tasks):
+    """Convert Tasks to Python dictionaries
+
+    :param tasks QuerySet Tasks to convert
+    :return list A list of serialized tasks
+    """
+    return list(iter_tasks_dict(tasks))
+
+
+def wants_stream():
+    """Check whether the request asks for a streaming response
+
+    Streaming is requested with stream=true argument or by accepting
+    NDJSON (application/x-ndjson).
+
+    :return bool True if the response should be streamed
+    """
+    stream = request.args.get('stream', '').lower() in ('1', 'true')
+
+    return stream or wants_ndjson()
+
+
+def wants_ndjson():
+    """Check whether NDJSON is the preferred response type
+
+    :return bool True if NDJSON should be returned
+    """
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def stream_response(items):
+    """Create a response streaming serialized items
+
+    The items are encoded one by one as a JSON array, or as NDJSON if the
+    client prefers it, so the response is never held in memory.
+
+    :param items iterable Serialized items, e.g., from iter_tasks_dict
+    :return Response Streaming response
+    """
+    if wants_ndjson():
+        def generate():
+            for item in items:
+                yield encode_json(item) + b'\n'
+
+        mimetype = NDJSON_MIMETYPE
+    else:
+        def generate():
+            separator = b'['
+            for item in items:
+                yield separator + encode_json(item)
+                separator = b','
+            yield b']' if separator == b',' else b'[]'
+
+        mimetype = 'application/json'
+
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+def encode_cursor(key):
+    """Encode a pagination cursor
+
+    :param key int Key of the last returned item
+    :return str Opaque cursor
+    """
+    cursor = json.dumps({'key': key}).encode('utf-8')
+
+    return base64.urlsafe_b64encode(cursor).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor
+
+    :param cursor str Cursor created by encode_cursor
+    :return int Key of the last returned item
+    :raise ValueError If the cursor is invalid
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        return int(json.loads(data.decode('utf-8'))['key'])
+    except (TypeError, KeyError, AttributeError, UnicodeError) as e:
+        raise ValueError(str(e))
+
+
+def encode_json(data):
+    """Encode data as JSON bytes
+
+    orjson or ujson is used if installed. Data they can't encode (e.g.,
+    too large integers) is encoded by the json module.
+
+    :param data Data to encode
+    :return bytes Encoded data
+    """
+    if _fast_dumps is not None:
+        try:
+            return _fast_dumps(data)
+        except (TypeError, ValueError, OverflowError):
+            pass
+
+    return json.dumps(data).encode('utf-8')
+
+
+def output_json(data, code, headers=None):
+    """Flask-RESTful representation of JSON responses
+
+    Data is encoded by encode_json, pre-encoded bytes (e.g., cached or
+    precomputed documents) are sent as they are.
+
+    :param data Data to encode or encoded bytes
+    :param code int HTTP status code
+    :param headers dict Additional headers
+    :return Response The response
+    """
+    body = data if isinstance(data, bytes) else encode_json(data)
+    response = Response(body, status=code, mimetype='application/json')
+    response.headers.extend(headers or {})
+
+    return response
+
+
+def compress_response(response):
+    """Compress a large response if the client accepts it
+
+    An after_request hook enabled by COMPRESSION config, responses of
+    at least COMPRESSION_MIN_SIZE bytes are compressed with brotli (if
+    installed) or gzip. The ETag of the compressed response is weak.
+
+    :param response Response The response
+    :return Response The (compressed) response
+    """
+    config = current_app.config
+    if (not config.get('COMPRESSION') or response.status_code != 200 or
+            response.direct_passthrough or response.is_streamed or
+            'Content-Encoding' in response.headers):
+        return response
+
+    body = response.get_data()
+    if len(body) < config.get('COMPRESSION_MIN_SIZE', 1024):
+        return response
+
+    if brotli is not None and request.accept_encodings['br']:
+        body = brotli.compress(body)
+        encoding = 'br'
+    elif request.accept_encodings['gzip']:
+        buf = BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6) as f:
+            f.write(body)
+        body = buf.getvalue()
+        encoding = 'gzip'
+    else:
+        return response
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+def precomputed_response(body, max_age=24 * 60 * 60):
+    """Create a response serving pre-encoded JSON
+
+    The response has its own strong ETag and can be cached by clients.
+
+    :param body bytes Encoded JSON, e.g., from encode_json
+    :param max_age int Cache-Control max-age (seconds)
+    :return Response The response
+    """
+    response = Response(body, mimetype='application/json')
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.set_etag(hashlib.sha1(body).hexdigest())
 
-    return result
+    return response
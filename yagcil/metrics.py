@@ -0,0 +1,283 @@
+"""
+    Request instrumentation
+
+    Per-endpoint request latency, MongoDB commands (counted by pymongo
+    command monitoring) and JSON serialization time are exposed on
+    /metrics in Prometheus text format. With PROFILER_ENABLED config,
+    ?__profile=1 returns cProfile output of a single request instead of
+    its response.
+"""
+import cProfile
+import pstats
+import threading
+import time
+from functools import wraps
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from flask import current_app, request
+from flask.ext.restful.representations.json import output_json
+from pymongo import monitoring
+
+
+class Histogram(object):
+    """Cumulative histogram of observed values"""
+
+    BUCKETS = (
+        0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+    )
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry(object):
+    """Metrics labeled by the endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {name: (help, {endpoint: Histogram})}
+        self.histograms = {}
+        # {name: (help, {endpoint: value})}
+        self.counters = {}
+        # {name: (help, callback)}
+        self.gauges = {}
+
+    def observe(self, name, description, endpoint, value):
+        """Observe a value of a histogram"""
+        with self.lock:
+            _, histograms = self.histograms.setdefault(
+                name, (description, {})
+            )
+            histograms.setdefault(endpoint, Histogram()).observe(value)
+
+    def inc(self, name, description, endpoint, value=1):
+        """Increase a counter"""
+        with self.lock:
+            _, counters = self.counters.setdefault(name, (description, {}))
+            counters[endpoint] = counters.get(endpoint, 0) + value
+
+    def gauge(self, name, description, callback):
+        """Register a gauge read when the metrics are rendered
+
+        :param callback callable Function returning the gauge's value
+        """
+        self.gauges[name] = (description, callback)
+
+    def counter(self, name, endpoint):
+        """Get the value of a counter
+
+        :return int Value, 0 when nothing was counted yet
+        """
+        with self.lock:
+            _, counters = self.counters.get(name, (None, {}))
+
+            return counters.get(endpoint, 0)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self):
+        """Render the metrics in Prometheus text format
+
+        :return str Metrics
+        """
+        lines = []
+        with self.lock:
+            for name, (description, histograms) in sorted(
+                    self.histograms.items()):
+                lines.append('# HELP {0} {1}'.format(name, description))
+                lines.append('# TYPE {0} histogram'.format(name))
+                for endpoint, histogram in sorted(histograms.items()):
+                    bounds = [str(bound) for bound in Histogram.BUCKETS]
+                    counts = histogram.counts + [histogram.count]
+                    for bound, count in zip(bounds + ['+Inf'], counts):
+                        lines.append(
+                            '{0}_bucket{{endpoint="{1}",le="{2}"}} {3}'.format(
+                                name, endpoint, bound, count
+                            )
+                        )
+                    lines.append('{0}_sum{{endpoint="{1}"}} {2}'.format(
+                        name, endpoint, histogram.sum
+                    ))
+                    lines.append('{0}_count{{endpoint="{1}"}} {2}'.format(
+                        name, endpoint, histogram.count
+                    ))
+
+            for name, (description, counters) in sorted(
+                    self.counters.items()):
+                lines.append('# HELP {0} {1}'.format(name, description))
+                lines.append('# TYPE {0} counter'.format(name))
+                for endpoint, value in sorted(counters.items()):
+                    lines.append('{0}{{endpoint="{1}"}} {2}'.format(
+                        name, endpoint, value
+                    ))
+
+        for name, (description, callback) in sorted(self.gauges.items()):
+            lines.append('# HELP {0} {1}'.format(name, description))
+            lines.append('# TYPE {0} gauge'.format(name))
+            lines.append('{0} {1}'.format(name, callback()))
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+# Stack of the measurements of the requests handled by the thread,
+# nested for the /batch sub-requests
+local = threading.local()
+
+
+def current_measurements():
+    """Get measurements of the requests being handled by the thread
+
+    :return list Measurements, the innermost request is the last one
+    """
+    if not hasattr(local, 'stack'):
+        local.stack = []
+
+    return local.stack
+
+
+class CommandListener(monitoring.CommandListener):
+    """Count MongoDB commands and their time"""
+
+    @staticmethod
+    def __record(event):
+        for measurement in current_measurements():
+            measurement['mongo_commands'] += 1
+            measurement['mongo_time'] += event.duration_micros / 1e6
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.__record(event)
+
+    def failed(self, event):
+        self.__record(event)
+
+
+# Must be registered before the MongoDB connection is created
+monitoring.register(CommandListener())
+
+
+def timed_representation(representation):
+    """Measure the serialization time of a Flask-RESTful representation"""
+
+    @wraps(representation)
+    def wrapper(*args, **kwargs):
+        start = time.time()
+        response = representation(*args, **kwargs)
+        elapsed = time.time() - start
+        for measurement in current_measurements():
+            measurement['serialization_time'] += elapsed
+
+        return response
+
+    return wrapper
+
+
+def profiled(view):
+    """Return cProfile output of a view when requested with __profile=1"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        enabled = current_app.config.get('PROFILER_ENABLED')
+        if not enabled or request.args.get('__profile') != '1':
+            return view(*args, **kwargs)
+
+        profiler = cProfile.Profile()
+        response = profiler.runcall(view, *args, **kwargs)
+        # Include generating the body of streamed responses
+        profiler.runcall(response.get_data)
+
+        output = StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(50)
+
+        return current_app.response_class(
+            output.getvalue(), mimetype='text/plain'
+        )
+
+    return wrapper
+
+
+def init_app(app, api):
+    """Instrument the app and add /metrics endpoint
+
+    :param app Flask The app
+    :param api Api Flask-RESTful API of the app
+    """
+
+    @app.before_request
+    def start_measurement():
+        current_measurements().append({
+            'start': time.time(),
+            'mongo_commands': 0,
+            'mongo_time': 0.0,
+            'serialization_time': 0.0
+        })
+
+    @app.after_request
+    def record_measurement(response):
+        stack = current_measurements()
+        if not stack:
+            return response
+
+        measurement = stack[-1]
+        endpoint = request.endpoint or 'unknown'
+        registry.observe(
+            'yagcil_request_duration_seconds', 'Request latency',
+            endpoint, time.time() - measurement['start']
+        )
+        registry.inc(
+            'yagcil_requests_total', 'Number of requests', endpoint
+        )
+        registry.inc(
+            'yagcil_mongo_commands_total', 'Number of MongoDB commands',
+            endpoint, measurement['mongo_commands']
+        )
+        registry.observe(
+            'yagcil_mongo_duration_seconds',
+            'Time spent in MongoDB commands per request',
+            endpoint, measurement['mongo_time']
+        )
+        registry.observe(
+            'yagcil_serialization_duration_seconds',
+            'Time spent encoding JSON per request',
+            endpoint, measurement['serialization_time']
+        )
+
+        return response
+
+    @app.teardown_request
+    def end_measurement(exception=None):
+        stack = current_measurements()
+        if stack:
+            stack.pop()
+
+    def metrics():
+        return app.response_class(
+            registry.render(), mimetype='text/plain; version=0.0.4'
+        )
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
+
+    representation = api.representations.get('application/json')
+    api.representations['application/json'] = timed_representation(
+        representation or output_json
+    )
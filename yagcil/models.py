@@ -1,10 +1,104 @@
 """
     MongoDB data models
 """
+from collections import Counter
+from datetime import datetime
 
 import mongoengine as me
 
 
+def serialize(document_class, values, org_names=None):
+    """Map field values to the API representation of a model
+
+    The representation is declared by the model's api_fields, a tuple of
+    (API name, field name) pairs. References are represented by the
+    name of the referenced organization.
+
+    :param document_class type Serialized model
+    :param values dict Field values keyed by the field names
+    :param org_names dict Organization names keyed by their ids
+    :return dict Serialized data
+    """
+    result = {}
+    for api_name, field_name in document_class.api_fields:
+        field = document_class._fields[field_name]
+        value = values.get(field_name)
+        if isinstance(field, me.ReferenceField):
+            value = (org_names or {}).get(getattr(value, 'id', value))
+        elif value is None and field.default is not None:
+            value = field.default
+            if callable(value):
+                value = value()
+
+        result[api_name] = value
+
+    return result
+
+
+def raw_to_dict(document_class, raw, org_names=None):
+    """Serialize a raw MongoDB document without building a model instance
+
+    :param document_class type Model of the document
+    :param raw dict Raw document, e.g., from QuerySet.as_pymongo()
+    :param org_names dict Organization names keyed by their ids
+    :return dict Serialized data, the same as document's to_dict()
+    """
+    values = dict(
+        (name, raw.get(document_class._fields[name].db_field))
+        for _, name in document_class.api_fields
+    )
+
+    return serialize(document_class, values, org_names)
+
+
+def organizations_by_year_pipeline(years):
+    """Aggregation grouping organizations by the year
+
+    :param years list GCI years
+    :return list Pipeline resulting in [{'_id': year, 'orgs': raw
+                 organizations with the fields of the API representation}]
+    """
+    fields = [
+        Organization._fields[name].db_field
+        for name in api_field_names(Organization)
+    ]
+
+    return [
+        {'$match': {Organization._fields['year'].db_field: {'$in': years}}},
+        {'$group': {
+            '_id': '$' + Organization._fields['year'].db_field,
+            'orgs': {'$push': dict((field, '$' + field) for field in fields)}
+        }}
+    ]
+
+
+def rank_position_pipeline(student, count):
+    """Aggregation counting the students ranked before a student
+
+    :param student str Student's name
+    :param count int Number of the student's tasks
+    :return list Pipeline resulting in [{'ahead': number of students}],
+                 or no documents if there are none
+    """
+    return [
+        {'$group': {'_id': '$student', 'tasks': {'$sum': 1}}},
+        {'$match': {'$or': [
+            {'tasks': {'$gt': count}},
+            {'tasks': count, '_id': {'$lt': student}}
+        ]}},
+        {'$group': {'_id': None, 'ahead': {'$sum': 1}}}
+    ]
+
+
+def api_field_names(document_class):
+    """Get names of the fields used by the API representation of a model
+
+    :param document_class type Serialized model
+    :return list Field names, e.g., for QuerySet.only()
+    """
+    return [name for _, name in document_class.api_fields]
+
+
 class Organization(me.Document):
     """Organization model
 
@@ -17,16 +111,43 @@ class Organization(me.Document):
     full_name = me.StringField()
     year = me.IntField(required=True)
 
+    meta = {
+        'indexes': [
+            # (year, name) covers lookups by year as well
+            {'fields': ['year', 'name'], 'unique': True}
+        ]
+    }
+
+    api_fields = (
+        ('name', 'name'),
+        ('fullName', 'full_name'),
+        ('year', 'year')
+    )
+
     def to_dict(self):
         """Serialize Organization data
 
         :return dict Serialized Organization data
         """
-        return {
-            'name': self.name,
-            'fullName': self.full_name,
-            'year': self.year
-        }
+        return serialize(Organization, self._data)
+
+    @staticmethod
+    def group_by_year(years):
+        """Get organizations of many years in a single query
+
+        :param years list GCI years
+        :return dict Serialized organizations keyed by the year
+        """
+        orgs = Organization.objects.aggregate(
+            *organizations_by_year_pipeline(years)
+        )
+
+        return dict(
+            (item['_id'], [
+                raw_to_dict(Organization, raw) for raw in item['orgs']
+            ])
+            for item in orgs
+        )
 
 
 class Task(me.Document):
@@ -46,28 +167,55 @@ class Task(me.Document):
     categories = me.ListField(me.StringField())
     title = me.StringField(required=True)
 
-    def to_dict(self):
+    meta = {
+        'indexes': [
+            # Trailing key serves the sorting of the paginated task list
+            ['year', 'key'],
+            ['year', 'org', 'key'],
+            ['org', 'student'],
+            ['student', 'year', 'key']
+        ]
+    }
+
+    api_fields = (
+        ('id', 'key'),
+        ('title', 'title'),
+        ('orgName', 'org'),
+        ('year', 'year'),
+        ('student', 'student'),
+        ('categories', 'categories')
+    )
+
+    @property
+    def org_id(self):
+        """Id of the task's organization, read without dereferencing it"""
+        org = self._data.get('org')
+        return getattr(org, 'id', org)
+
+    def to_dict(self, org_names=None):
         """Serialize Task data
 
+        :param org_names dict Optional organization names keyed by org id,
+                              used instead of dereferencing the org
         :return dict Serialized Task data
         """
-        return {
-            'id': self.key,
-            'title': self.title,
-            'orgName': self.org.name,
-            'year': self.year,
-            'student': self.student,
-            'categories': self.categories
-        }
+        if org_names is None:
+            # yagcil.cache depends on this module
+            from yagcil.cache import organizations
+            org_names = organizations.get_names([self.org_id])
+
+        return serialize(Task, self._data, org_names)
 
     @staticmethod
     def count_categories(year, org_name=None, student=None, tasks=None):
         """Get categories count by an organization or a student
 
+        The categories are counted by MongoDB, no tasks are loaded.
+
         :param year int GCI Year
         :param org_name str Organization's name
         :param student str Student's name
-        :param tasks list(Task) Optional list of tasks to work on
+        :param tasks QuerySet Optional QuerySet of tasks to work on
 
         :return dict A number of tasks in each category
                      e.g, { 'Category': number of tasks }
@@ -76,20 +224,571 @@ class Task(me.Document):
             tasks = Task.objects(year=year)
 
         if org_name is not None:
-            try:
-                org = Organization.objects.get(
-                    name=org_name, year=year
-                )
-                tasks = Task.objects(org=org)
-            except me.DoesNotExist:
+            # yagcil.cache depends on this module
+            from yagcil.cache import organizations
+            org_id = organizations.get_id(org_name, year)
+            if org_id is None:
                 return []
 
+            tasks = tasks.filter(org=org_id)
+
         if student is not None:
             tasks = tasks.filter(student=student)
 
-        categories = {}
-        for task in tasks:
-            for category in task.categories:
-                categories[category] = categories.get(category, 0) + 1
+        pipeline = [
+            {'$project': {'categories': 1}},
+            {'$unwind': '$categories'},
+            {'$group': {'_id': '$categories', 'count': {'$sum': 1}}}
+        ]
+
+        return dict(
+            (item['_id'], item['count'])
+            for item in tasks.aggregate(*pipeline)
+        )
+
+    @staticmethod
+    def rank(tasks, skip=0, limit=None):
+        """Rank students by the number of tasks they have finished
+
+        The rank is computed by MongoDB, ties are broken by student's name.
+        A limited rank is sorted as top-k by MongoDB.
+
+        :param tasks QuerySet Tasks to rank the students by
+        :param skip int Number of the leading students to leave out
+        :param limit int Maximum number of the students returned
+        :return list A list of students sorted by the number of tasks,
+                     e.g., [{'student': 'Name', 'tasks': 3}]
+        """
+        pipeline = [
+            {'$group': {'_id': '$student', 'tasks': {'$sum': 1}}},
+            {'$sort': {'tasks': -1, '_id': 1}}
+        ]
+        if skip:
+            pipeline.append({'$skip': skip})
+        if limit is not None:
+            pipeline.append({'$limit': limit})
+
+        return [
+            {'student': item['_id'], 'tasks': item['tasks']}
+            for item in tasks.aggregate(*pipeline)
+        ]
+
+    @staticmethod
+    def rank_by_year(tasks, limit=None):
+        """Rank students by the number of tasks in all the years
+
+        :param tasks QuerySet Tasks to rank the students by
+        :param limit int Maximum number of the students returned
+        :return list A list of students sorted by the number of tasks,
+                     with the number of tasks in each year, e.g.,
+                     [{'student': 'Name', 'tasks': 3,
+                       'years': [{'year': 2014, 'tasks': 3}]}]
+        """
+        pipeline = [
+            {'$group': {
+                '_id': {'student': '$student', 'year': '$year'},
+                'tasks': {'$sum': 1}
+            }},
+            {'$sort': {'_id.year': 1}},
+            {'$group': {
+                '_id': '$_id.student',
+                'tasks': {'$sum': '$tasks'},
+                'years': {'$push': {'year': '$_id.year', 'tasks': '$tasks'}}
+            }},
+            {'$sort': {'tasks': -1, '_id': 1}}
+        ]
+        if limit is not None:
+            pipeline.append({'$limit': limit})
+
+        return [
+            {
+                'student': item['_id'],
+                'tasks': item['tasks'],
+                'years': item['years']
+            }
+            for item in tasks.aggregate(*pipeline)
+        ]
+
+    @staticmethod
+    def count_categories_by_year(tasks):
+        """Count categories in each year
+
+        :param tasks QuerySet Tasks to count the categories of
+        :return dict A number of tasks in each category keyed by the year,
+                     e.g., {2014: {'Category': number of tasks}}
+        """
+        pipeline = [
+            {'$project': {'year': 1, 'categories': 1}},
+            {'$unwind': '$categories'},
+            {'$group': {
+                '_id': {'year': '$year', 'name': '$categories'},
+                'count': {'$sum': 1}
+            }}
+        ]
+
+        result = {}
+        for item in tasks.aggregate(*pipeline):
+            categories = result.setdefault(item['_id']['year'], {})
+            categories[item['_id']['name']] = item['count']
+
+        return result
+
+    @staticmethod
+    def rank_position(tasks, student, count):
+        """Get a student's position in the rank (see Task.rank)
+
+        :param tasks QuerySet Tasks to rank the students by
+        :param student str Student's name
+        :param count int Number of the student's tasks among the tasks
+        :return int|None Position starting at 1, None if the student
+                         has no tasks
+        """
+        if not count:
+            return None
+
+        ahead = list(tasks.aggregate(*rank_position_pipeline(student, count)))
+
+        return 1 + (ahead[0]['ahead'] if ahead else 0)
+
+
+class DataGeneration(me.Document):
+    """Pointer to the generation of precomputed data which is served
+
+    :var name Name of the pointer, only 'current' is used
+    :var generation Number of the current generation
+    :var updated_at Time when the generation has been published
+    :var changed_at Time when the crawled data has last been changed
+    """
+    name = me.StringField(primary_key=True, default='current')
+    generation = me.IntField(required=True, default=0)
+    updated_at = me.DateTimeField()
+    changed_at = me.DateTimeField()
+
+    @staticmethod
+    def current():
+        """Get the current data generation
+
+        :return DataGeneration|None The current generation, None if no
+                                    data has been published yet
+        """
+        return DataGeneration.objects(name='current').first()
+
+    @staticmethod
+    def publish(generation):
+        """Atomically switch readers to a new generation
+
+        :param generation int Number of the generation to publish
+        """
+        DataGeneration.objects(name='current').update_one(
+            set__generation=generation,
+            set__updated_at=datetime.utcnow(),
+            upsert=True
+        )
+
+    @staticmethod
+    def mark_changed():
+        """Record that the crawled data is being changed
+
+        Called before the data is written, so the change is published
+        even if the crawl dies before it publishes a new generation.
+        """
+        DataGeneration.objects(name='current').update_one(
+            set__changed_at=datetime.utcnow()
+        )
+
+    @staticmethod
+    def unpublished():
+        """Whether the data has changed since the last publication
+
+        :return bool True if there are unpublished changes or no
+                     generation has been published yet
+        """
+        current = DataGeneration.current()
+        if current is None or current.updated_at is None:
+            return True
+
+        return (current.changed_at is not None and
+                current.changed_at > current.updated_at)
+
+
+class Leaderboard(me.Document):
+    """Precomputed rank and statistics of a year or an organization
+
+    :var generation Data generation the leaderboard belongs to
+    :var year GCI year
+    :var org_name Organization's name, None for the whole year
+    :var rank Students sorted by the number of tasks (see Task.rank)
+    :var categories Number of tasks in each category,
+                    e.g., [{'name': 'Code', 'count': 3}]
+    """
+    generation = me.IntField(required=True)
+    year = me.IntField(required=True)
+    org_name = me.StringField()
+    rank = me.ListField(me.DictField())
+    categories = me.ListField(me.DictField())
+
+    meta = {
+        'indexes': [
+            {'fields': ['generation', 'year', 'org_name'], 'unique': True}
+        ]
+    }
+
+    def categories_dict(self):
+        """Get categories in the format returned by Task.count_categories
+
+        :return dict A number of tasks in each category
+        """
+        return dict(
+            (category['name'], category['count'])
+            for category in self.categories
+        )
+
+    @staticmethod
+    def get_current(generation, year, org_name=None, skip=0, limit=None):
+        """Get a leaderboard of the current data generation
+
+        :param generation int Number of the current generation (see
+                              yagcil.cache.generation), 0 if there is none
+        :param year int GCI year
+        :param org_name str Organization's name, None for the whole year
+        :param skip int Number of the leading rank entries to leave out
+                        (used with the limit)
+        :param limit int Maximum number of the rank entries loaded
+        :return Leaderboard|None The leaderboard, None if it hasn't been
+                                 materialized
+        """
+        if not generation:
+            return None
+
+        leaderboards = Leaderboard.objects(
+            generation=generation, year=year, org_name=org_name
+        )
+        if limit is not None:
+            # Only the slice of the rank is loaded
+            leaderboards = leaderboards.fields(slice__rank=[skip, limit])
+
+        return leaderboards.first()
+
+    @staticmethod
+    def __build_year(generation, year):
+        """Build leaderboards and student profiles of a year
+
+        :param generation int Data generation to build
+        :param year int GCI year
+        :return tuple Built (unsaved) leaderboards of the year and all its
+                      organizations, and student profiles
+        """
+        org_names = dict(
+            (org.id, org.name) for org in Organization.objects(year=year)
+        )
+        leaderboards = {None: Leaderboard(
+            generation=generation, year=year
+        )}
+        for org_name in org_names.values():
+            leaderboards[org_name] = Leaderboard(
+                generation=generation, year=year, org_name=org_name
+            )
+
+        tasks = Task.objects(year=year)
+        leaderboards[None].rank = Task.rank(tasks)
+        leaderboards[None].categories = [
+            {'name': name, 'count': count}
+            for name, count in sorted(Task.count_categories(year).items())
+        ]
+
+        # Rank and categories of all the organizations in two queries
+        rank = tasks.aggregate(
+            {'$group': {
+                '_id': {'org': '$org', 'student': '$student'},
+                'tasks': {'$sum': 1}
+            }},
+            {'$sort': {'tasks': -1, '_id.student': 1}}
+        )
+        for item in rank:
+            org_name = org_names.get(item['_id']['org'])
+            if org_name is not None:
+                leaderboards[org_name].rank.append({
+                    'student': item['_id']['student'],
+                    'tasks': item['tasks']
+                })
+
+        categories = tasks.aggregate(
+            {'$project': {'org': 1, 'categories': 1}},
+            {'$unwind': '$categories'},
+            {'$group': {
+                '_id': {'org': '$org', 'name': '$categories'},
+                'count': {'$sum': 1}
+            }},
+            {'$sort': {'_id.name': 1}}
+        )
+        for item in categories:
+            org_name = org_names.get(item['_id']['org'])
+            if org_name is not None:
+                leaderboards[org_name].categories.append({
+                    'name': item['_id']['name'],
+                    'count': item['count']
+                })
+
+        profiles = StudentProfile.build(
+            generation, year, org_names, leaderboards
+        )
+
+        return list(leaderboards.values()), profiles
+
+    @staticmethod
+    def materialize(years):
+        """Build leaderboards of a new data generation and publish them
+
+        Readers keep using the previous generation until the new one is
+        completely written, the generation before it is then removed.
+
+        :param years list GCI years to build leaderboards for
+        :return int Number of the published generation
+        """
+        current = DataGeneration.current()
+        generation = current.generation + 1 if current is not None else 1
+        # Remove leftovers of a failed run
+        Leaderboard.objects(generation=generation).delete()
+        StudentProfile.objects(generation=generation).delete()
+
+        for year in years:
+            leaderboards, profiles = Leaderboard.__build_year(
+                generation, year
+            )
+            if leaderboards:
+                Leaderboard.objects.insert(leaderboards, load_bulk=False)
+            if profiles:
+                StudentProfile.objects.insert(profiles, load_bulk=False)
+
+        DataGeneration.publish(generation)
+        Leaderboard.objects(generation__lt=generation - 1).delete()
+        StudentProfile.objects(generation__lt=generation - 1).delete()
+
+        return generation
+
+
+class StudentProfile(me.Document):
+    """Precomputed tasks and statistics of a student in a year
+
+    :var generation Data generation the profile belongs to
+    :var year GCI year
+    :var student Student's name
+    :var rank Position in the rank of the year, starting at 1
+    :var tasks Serialized tasks (see Task.to_dict) sorted by the key
+    :var orgs Number of tasks and rank position in each organization,
+              e.g., [{'name': 'org', 'count': 3, 'rank': 1}]
+    :var categories Number of tasks in each category,
+                    e.g., [{'name': 'Code', 'count': 3}]
+    """
+    generation = me.IntField(required=True)
+    year = me.IntField(required=True)
+    student = me.StringField(required=True)
+    rank = me.IntField()
+    tasks = me.ListField(me.DictField())
+    orgs = me.ListField(me.DictField())
+    categories = me.ListField(me.DictField())
+
+    meta = {
+        'indexes': [
+            {'fields': ['generation', 'student', 'year'], 'unique': True}
+        ]
+    }
+
+    def to_dict(self, org_name=None):
+        """Serialize the profile, the same as StudentResource
+
+        :param org_name str Only the tasks of the organization are
+                            included and ranked, if given
+        :return dict Serialized profile
+        """
+        if org_name is None:
+            tasks = self.tasks
+            categories = dict(
+                (category['name'], category['count'])
+                for category in self.categories
+            )
+        else:
+            tasks = [
+                task for task in self.tasks if task['orgName'] == org_name
+            ]
+            categories = dict(Counter(
+                category for task in tasks for category in task['categories']
+            ))
+
+        return {
+            'student': self.student,
+            'tasks': tasks,
+            'stats': {
+                'categories': categories,
+                'rank': self.position(org_name)
+            }
+        }
+
+    def position(self, org_name=None):
+        """Get the student's position in the rank of the year or an org
+
+        :param org_name str Organization's name, None for the whole year
+        :return int|None Position starting at 1, None if the student
+                         has no tasks there
+        """
+        if org_name is None:
+            return self.rank
+
+        for org in self.orgs:
+            if org['name'] == org_name:
+                return org['rank']
+
+        return None
+
+    @staticmethod
+    def get_current(generation, student, year):
+        """Get a profile of the current data generation
+
+        :param generation int Number of the current generation (see
+                              yagcil.cache.generation), 0 if there is none
+        :param student str Student's name
+        :param year int GCI year
+        :return StudentProfile|None The profile, an empty one if the
+                                    student has no tasks, None if the
+                                    profiles haven't been materialized
+        """
+        if not generation:
+            return None
+
+        profile = StudentProfile.objects(
+            generation=generation, student=student, year=year
+        ).first()
+        if profile is None:
+            profile = StudentProfile(
+                generation=generation, student=student, year=year
+            )
+
+        return profile
+
+    @staticmethod
+    def build(generation, year, org_names, leaderboards):
+        """Build profiles of all students of a year
+
+        :param generation int Data generation to build
+        :param year int GCI year
+        :param org_names dict Names of the year's organizations keyed by
+                              their ids
+        :param leaderboards dict Built leaderboards of the year (None key)
+                                 and its organizations (keyed by the name)
+        :return list Built (unsaved) profiles
+        """
+        profiles = {}
+        tasks = Task.objects(year=year).order_by('key')
+        tasks = tasks.only(*api_field_names(Task)).no_cache().as_pymongo()
+        for raw in tasks:
+            task = raw_to_dict(Task, raw, org_names)
+            profile = profiles.get(task['student'])
+            if profile is None:
+                profile = profiles[task['student']] = StudentProfile(
+                    generation=generation, year=year, student=task['student']
+                )
+            profile.tasks.append(task)
+
+        for org_name, leaderboard in sorted(
+                leaderboards.items(), key=lambda x: x[0] or ''):
+            for position, item in enumerate(leaderboard.rank, 1):
+                profile = profiles.get(item['student'])
+                if profile is None:
+                    # The task has been added after the leaderboard
+                    continue
+                if org_name is None:
+                    profile.rank = position
+                else:
+                    profile.orgs.append({
+                        'name': org_name,
+                        'count': item['tasks'],
+                        'rank': position
+                    })
+
+        for profile in profiles.values():
+            categories = Counter(
+                category
+                for task in profile.tasks
+                for category in task['categories']
+            )
+            profile.categories = [
+                {'name': name, 'count': count}
+                for name, count in sorted(categories.items())
+            ]
+
+        return list(profiles.values())
+
+
+class CrawlState(me.Document):
+    """Incremental crawl state of an organization
+
+    :var year GCI year
+    :var org_name Organization's name
+    :var fetched_at Time when the last complete fetch has finished
+    :var content_hash Hash of the whole payload of the last complete fetch
+    :var page_hashes Hashes of the pages of the last complete fetch
+    :var cursor Start key of the next page of an unfinished fetch
+    :var pending_hashes Hashes of the pages of an unfinished fetch
+    """
+    year = me.IntField(required=True)
+    org_name = me.StringField(required=True)
+    fetched_at = me.DateTimeField()
+    content_hash = me.StringField()
+    page_hashes = me.ListField(me.StringField())
+    cursor = me.StringField()
+    pending_hashes = me.ListField(me.StringField())
+
+    meta = {
+        'indexes': [
+            {'fields': ['year', 'org_name'], 'unique': True}
+        ]
+    }
+
+
+class CachedResponse(me.Document):
+    """Response stored in the shared response cache tier
+
+    :var key Cache key (includes the data generation)
+    :var body Response body
+    :var headers Response headers as [name, value] pairs
+    :var created Time when the response has been stored
+    """
+    key = me.StringField(primary_key=True)
+    body = me.BinaryField()
+    headers = me.ListField(me.ListField(me.StringField()))
+    created = me.DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'indexes': [
+            # Entries of old generations are never read, let them expire
+            {'fields': ['created'], 'expireAfterSeconds': 24 * 60 * 60}
+        ]
+    }
+
+
+def check_indexes(logger, build=True):
+    """Report indexes missing in the database and build them
+
+    :param logger Logger Logger to report the missing indexes to
+    :param build bool Whether the missing indexes should be built
+    :return dict Missing indexes keyed by the model name
+    """
+    missing = {}
+    documents = (
+        Organization, Task, DataGeneration, Leaderboard, StudentProfile,
+        CrawlState, CachedResponse
+    )
+    for document in documents:
+        indexes = document.compare_indexes()['missing']
+        if not indexes:
+            continue
+
+        logger.warning(
+            'Missing indexes on %s: %s', document.__name__, indexes
+        )
+        missing[document.__name__] = indexes
+        if build:
+            document.ensure_indexes()
+            logger.info('Built indexes on %s', document.__name__)
 
-        return categories
+    return missing
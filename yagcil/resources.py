@@ -2,21 +2,34 @@
     API Server resources
 """
 import re
-from operator import itemgetter
+import json
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 import mongoengine as me
+from flask import request
 from flask.ext import restful
 from flask.ext.restful import reqparse
+from werkzeug.urls import url_encode, url_decode, url_parse
 
 from yagcil import app, api
-from yagcil.models import Organization, Task
-from yagcil.errorhandlers import ResourceNotFound, ErrorCode
-from yagcil.helpers import queryset_to_dict
+from yagcil.models import Organization, Task, Leaderboard, StudentProfile
+from yagcil.cache import generation, organizations
+from yagcil.snapshot import snapshots
+from yagcil.errorhandlers import ResourceNotFound, BadRequest, ErrorCode
+from yagcil.helpers import (
+    queryset_to_dict, iter_queryset_dict, tasks_to_dict, iter_tasks_dict,
+    encode_cursor, decode_cursor, wants_stream, stream_response, string_types,
+    encode_json, precomputed_response
+)
 
 
 class OrganizationListResource(restful.Resource):
     """Get a list of all organizations"""
 
+    entry_point = 'organizationListUrl'
+    query_params = ('year',)
+
     def __init__(self):
         self.arg_parser = reqparse.RequestParser()
         self.arg_parser.add_argument(
@@ -34,30 +47,118 @@ class OrganizationListResource(restful.Resource):
         args = self.arg_parser.parse_args()
         year = args.get('year')
 
-        return queryset_to_dict(Organization.objects(year=year))
+        orgs = Organization.objects(year=year)
+        if wants_stream():
+            return stream_response(iter_queryset_dict(orgs))
+
+        return queryset_to_dict(orgs)
 
 
 class AllOrganizationListResource(restful.Resource):
     """Get a list of all organizations for every year"""
 
+    entry_point = 'organizationListAllUrl'
+
     def get(self):
         """Get a list of all organizations for every year
 
         :return list A list of all organizations for every year
         """
-        result = []
-        for year in app.config['YEARS']:
-            result.append({
-                'year': year,
-                'orgs': queryset_to_dict(Organization.objects(year=year))
-            })
+        years = app.config['YEARS']
+        orgs = Organization.group_by_year(years)
+
+        return [{'year': year, 'orgs': orgs.get(year, [])} for year in years]
+
+
+def _all_years_tasks(name=None):
+    """Get tasks of all the configured years
+
+    :param name str Organization's name, tasks of all orgs if None
+    :return QuerySet|None The tasks, None if the org has never taken part
+    """
+    years = app.config['YEARS']
+    if name is None:
+        return Task.objects(year__in=years)
+
+    org_ids = [organizations.get_id(name, year) for year in years]
+    org_ids = [org_id for org_id in org_ids if org_id is not None]
+    if not org_ids:
+        return None
+
+    return Task.objects(org__in=org_ids)
+
+
+class AllYearsRankResource(restful.Resource):
+    """Get all-time rank for organization/all orgs"""
+
+    entry_point = 'organizationRankAllUrl'
+    query_params = ('limit',)
+
+    def __init__(self):
+        self.arg_parser = reqparse.RequestParser()
+        self.arg_parser.add_argument(
+            'limit',
+            type=int,
+            help="Number of the top students (default: all students)"
+        )
+
+    def get(self, name=None):
+        """Get rank of all the years, computed in a single query
+
+        :param name str Organization name, rank of all orgs if None
+        :return list Students sorted by the number of tasks, with their
+                     number of tasks in each year
+        """
+        limit = self.arg_parser.parse_args().get('limit')
+        if limit is not None and limit <= 0:
+            limit = None
 
-        return result
+        tasks = _all_years_tasks(name)
+        if tasks is None:
+            return []
+
+        return Task.rank_by_year(tasks, limit)
+
+
+class AllYearsStatsResource(restful.Resource):
+    """Return all-time organization statistics"""
+
+    entry_point = 'organizationStatsAllUrl'
+
+    @staticmethod
+    def get(name=None):
+        """Get categories of all the years, computed in a single query
+
+        :param name str Organization name, stats of all orgs if None
+        :return dict Categories count in all the years and in each year
+        """
+        tasks = _all_years_tasks(name)
+        if tasks is None:
+            # The same types as for a known org
+            return {'categories': {}, 'years': []}
+
+        by_year = Task.count_categories_by_year(tasks)
+        categories = {}
+        for year_categories in by_year.values():
+            for category, count in year_categories.items():
+                categories[category] = categories.get(category, 0) + count
+
+        return {
+            'categories': categories,
+            'years': [
+                {'year': year, 'categories': by_year.get(year, {})}
+                for year in sorted(app.config['YEARS'])
+            ]
+        }
 
 
 class OrganizationResource(restful.Resource):
     """Get organization data"""
 
+    entry_point = 'organizationUrl'
+    # The published template, kept as it's been before it was derived
+    url_template = '/organization/{year}{/name}'
+
     @staticmethod
     def get(name, year):
         """Get information about an organization
@@ -77,43 +178,151 @@ class OrganizationResource(restful.Resource):
 class OrganizationRankResource(restful.Resource):
     """Get rank for organization/all orgs"""
 
-    @staticmethod
-    def get(year, name=None):
+    entry_point = 'organizationRankUrl'
+    query_params = ('limit', 'student', 'neighbours')
+
+    def __init__(self):
+        self.arg_parser = reqparse.RequestParser()
+        self.arg_parser.add_argument(
+            'limit',
+            type=int,
+            help="Number of the top students (default: all students)"
+        )
+        self.arg_parser.add_argument(
+            'student',
+            help="Student whose position and neighbours should be returned"
+        )
+        self.arg_parser.add_argument(
+            'neighbours',
+            type=int,
+            default=2,
+            help="Number of the students around the student"
+        )
+
+    def get(self, year, name=None):
         """Get rank for a specified organization
 
+        With the student argument, only the student and the neighbours
+        on both sides are returned, with their positions starting at 1.
+        The position is read from the snapshot or the student's profile
+        and only the slice of the rank around it is loaded.
+
         :param name str Organization name, use all to get rank of all orgs
         :param year int Year of GCI
-        :return:
+        :return list Students sorted by the number of tasks
         """
+        args = self.arg_parser.parse_args()
+        limit = args.get('limit')
+        if limit is not None and limit <= 0:
+            limit = None
 
+        # The position and the rank are read from the same data
+        snapshot = snapshots.get()
+        current = generation.current()
+        student = args.get('student')
+        if not student:
+            return OrganizationRankResource.__rank(
+                snapshot, current, year, name, 0, limit
+            )
+
+        position = OrganizationRankResource.__position(
+            snapshot, current, year, name, student
+        )
+        if position is None:
+            return []
+
+        neighbours = max(args.get('neighbours'), 0)
+        skip = max(position - 1 - neighbours, 0)
+        rank = OrganizationRankResource.__rank(
+            snapshot, current, year, name, skip, position + neighbours - skip
+        )
+
+        return [
+            dict(item, position=skip + i) for i, item in enumerate(rank, 1)
+        ]
+
+    @staticmethod
+    def __tasks(year, name):
+        """Get the ranked tasks, None if the organization doesn't exist"""
         if name is None:
-            tasks = Task.objects(year=year)
-        else:
-            try:
-                org = Organization.objects.get(
-                    name=name, year=year
-                )
-                tasks = Task.objects(org=org)
-            except me.DoesNotExist:
-                return []
+            return Task.objects(year=year)
+
+        org_id = organizations.get_id(name, year)
+        if org_id is None:
+            return None
+
+        return Task.objects(org=org_id)
+
+    @staticmethod
+    def __rank(snapshot, current, year, name, skip, limit):
+        """Get a slice of the rank
+
+        :param snapshot Snapshot|None Snapshot of the current generation
+        :param current int Number of the current generation
+        :return list Students sorted by the number of tasks
+        """
+        if snapshot is not None:
+            rank, _ = snapshot.ranking(year, name)
+            end = skip + limit if limit is not None else None
+            return rank[skip:end]
+
+        leaderboard = Leaderboard.get_current(current, year, name, skip, limit)
+        if leaderboard is not None:
+            return leaderboard.rank
+
+        tasks = OrganizationRankResource.__tasks(year, name)
+        if tasks is None:
+            return []
 
-        tasks_students = [x.student for x in tasks]
-        rank = []
-        for student in set(tasks_students):
-            rank.append({
-                'student': student,
-                'tasks': tasks_students.count(student)
-            })
+        return Task.rank(tasks, skip, limit)
 
-        return sorted(rank, key=itemgetter('tasks'), reverse=True)
+    @staticmethod
+    def __position(snapshot, current, year, name, student):
+        """Get a student's position in the rank
+
+        :param snapshot Snapshot|None Snapshot of the current generation
+        :param current int Number of the current generation
+        :return int|None Position starting at 1, None if the student
+                         isn't ranked
+        """
+        if snapshot is not None:
+            return snapshot.rank_position(year, name, student)
+
+        profile = StudentProfile.get_current(current, student, year)
+        if profile is not None:
+            return profile.position(name)
+
+        tasks = OrganizationRankResource.__tasks(year, name)
+        if tasks is None:
+            return None
+
+        count = tasks.filter(student=student).count()
+
+        return Task.rank_position(tasks, student, count)
 
 
 class OrganizationStatsResource(restful.Resource):
     """Return organization statistics"""
 
+    entry_point = 'organizationStatsUrl'
+
     @staticmethod
     def get(year, name=None):
         """Get org stats"""
+        snapshot = snapshots.get()
+        if snapshot is not None:
+            rows = snapshot.rows(year, name)
+            return {
+                'categories': snapshot.count_categories(rows)
+                if rows is not None else []
+            }
+
+        leaderboard = Leaderboard.get_current(generation.current(), year, name)
+        if leaderboard is not None:
+            return {
+                'categories': leaderboard.categories_dict()
+            }
+
         args = dict(year=year)
         if name is not None:
             args['org_name'] = name
@@ -128,6 +337,11 @@ class OrganizationStatsResource(restful.Resource):
 class TaskListResource(restful.Resource):
     """Get a list of all organizations"""
 
+    entry_point = 'taskListUrl'
+    query_params = (
+        'org', 'student', 'year', 'limit', 'offset', 'cursor', 'stream'
+    )
+
     def __init__(self):
         self.arg_parser = reqparse.RequestParser()
         self.arg_parser.add_argument(
@@ -147,7 +361,8 @@ class TaskListResource(restful.Resource):
         self.arg_parser.add_argument(
             'limit',
             type=int,
-            help="Results length limit"
+            help="Results length limit (default and maximum: "
+                 "TASK_LIST_MAX_LIMIT config)"
         )
         self.arg_parser.add_argument(
             'offset',
@@ -155,10 +370,20 @@ class TaskListResource(restful.Resource):
             default=0,
             help="Results offset"
         )
+        self.arg_parser.add_argument(
+            'cursor',
+            help="Cursor of the next page (X-Next-Cursor header)"
+        )
 
     def get(self):
         """Get a list of all tasks
 
+        The tasks are sorted by their id. If there might be more results
+        the next page is linked with Link and X-Next-Cursor headers.
+
+        A streaming response (see helpers.wants_stream) isn't limited
+        unless the limit is given and has no pagination headers.
+
         :return list A list of all tasks
         """
         args = self.arg_parser.parse_args()
@@ -167,30 +392,77 @@ class TaskListResource(restful.Resource):
         year = args.get('year')
         limit = args.get('limit')
         offset = args.get('offset')
+        cursor = args.get('cursor')
 
-        query = Task.objects(year=year)
-        if org_name:
-            try:
-                org = Organization.objects.get(name=org_name, year=year)
-            except me.DoesNotExist:
+        stream = wants_stream()
+        max_limit = app.config['TASK_LIST_MAX_LIMIT']
+        if stream:
+            if limit is not None and limit <= 0:
+                limit = None
+        elif limit is None or limit <= 0 or limit > max_limit:
+            limit = max_limit
+
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            raise BadRequest('Invalid cursor', ErrorCode.InvalidCursor)
+
+        snapshot = snapshots.get()
+        if snapshot is not None:
+            rows = snapshot.rows(year, org_name or None, student or None)
+            if rows is None:
                 return []
 
-            query = query.filter(org=org)
+            if after is not None:
+                rows = snapshot.after(rows, after)
+            end = offset + limit if limit is not None else None
+            tasks = snapshot.iter_tasks(rows[offset:end])
+        else:
+            query = Task.objects(year=year)
+            if org_name:
+                org_id = organizations.get_id(org_name, year)
+                if org_id is None:
+                    return []
+
+                query = query.filter(org=org_id)
 
-        if student:
-            query = query.filter(student=student)
+            if student:
+                query = query.filter(student=student)
 
-        if limit is not None:
-            query = query.limit(limit)
+            if after is not None:
+                query = query.filter(key__gt=after)
 
-        query = query.skip(offset)
+            query = query.order_by('key').skip(offset)
+            if limit is not None:
+                query = query.limit(limit)
+            tasks = iter_tasks_dict(query)
 
-        return queryset_to_dict(query)
+        if stream:
+            return stream_response(tasks)
+
+        tasks = list(tasks)
+        if len(tasks) < limit:
+            return tasks
+
+        next_cursor = encode_cursor(tasks[-1]['id'])
+        next_args = request.args.copy()
+        next_args.pop('offset', None)
+        next_args['cursor'] = next_cursor
+
+        return tasks, 200, {
+            'X-Next-Cursor': next_cursor,
+            'Link': '<{url}?{args}>; rel="next"'.format(
+                url=request.base_url, args=url_encode(next_args)
+            )
+        }
 
 
 class TaskResource(restful.Resource):
     """Get task's data"""
 
+    entry_point = 'taskUrl'
+    url_params_aliases = {'task_id': 'id'}
+
     @staticmethod
     def get(task_id):
         """Get information about a task
@@ -209,32 +481,158 @@ class TaskResource(restful.Resource):
 class StudentResource(restful.Resource):
     """Return student's stats"""
 
+    entry_point = 'studentUrl'
+
     @staticmethod
     def get(name, year, org_name=None):
-        """Get org stats"""
+        """Get student's tasks and stats
+
+        The stats include the student's position in the rank of the year
+        or of the organization (None if the student has no tasks there).
+        The position is read from the snapshot or the materialized
+        profiles, it's None until they're available.
+        """
+        snapshot = snapshots.get()
+        if snapshot is not None:
+            rows = snapshot.rows(year, org_name, student=name)
+            if rows is None:
+                return []
+
+            return {
+                'student': name,
+                'tasks': list(snapshot.iter_tasks(rows)),
+                'stats': {
+                    'categories': snapshot.count_categories(rows),
+                    'rank': snapshot.rank_position(year, org_name, name)
+                }
+            }
+
+        profile = StudentProfile.get_current(generation.current(), name, year)
+        if profile is not None:
+            known_org = org_name is None or any(
+                org['name'] == org_name for org in profile.orgs
+            )
+            if not known_org and organizations.get_id(org_name, year) is None:
+                return []
+
+            return profile.to_dict(org_name)
+
         tasks = Task.objects(student=name, year=year)
         if org_name is not None:
-            try:
-                org = Organization.objects.get(
-                    name=org_name, year=year
-                )
-                tasks = tasks.filter(org=org)
-            except me.DoesNotExist:
+            org_id = organizations.get_id(org_name, year)
+            if org_id is None:
                 return []
 
-        categories = Task.count_categories(year=year, tasks=tasks)
+            tasks = tasks.filter(org=org_id)
 
         return {
             'student': name,
-            'tasks': [task.to_dict() for task in tasks],
+            'tasks': tasks_to_dict(tasks),
             'stats': {
-                'categories': categories
+                'categories': Task.count_categories(year=year, tasks=tasks),
+                'rank': None
             }
         }
 
 
+class BatchResource(restful.Resource):
+    """Execute many GET requests in one round trip"""
+
+    entry_point = 'batchUrl'
+
+    @staticmethod
+    def post():
+        """Execute GET sub-requests in-process
+
+        The body is {"requests": [url, ...], "parallel": false}, e.g.,
+        {"requests": ["/config", "/organization/2014/rank"]}. Identical
+        sub-requests are executed once.
+
+        :return dict {"responses": [{"path", "status", "body"}, ...]}
+        """
+        body = request.get_json(force=True, silent=True)
+        paths = body.get('requests') if isinstance(body, dict) else None
+        valid = isinstance(paths, list) and all(
+            isinstance(x, string_types) for x in paths
+        )
+        if not valid:
+            raise BadRequest(
+                'Expected {"requests": [url, ...]}', ErrorCode.InvalidBatch
+            )
+
+        max_requests = app.config['BATCH_MAX_REQUESTS']
+        if len(paths) > max_requests:
+            raise BadRequest(
+                'At most {0} requests are allowed'.format(max_requests),
+                ErrorCode.InvalidBatch
+            )
+
+        normalized = [BatchResource.__normalize(x) for x in paths]
+        unique = list(OrderedDict.fromkeys(normalized))
+        workers = min(app.config['BATCH_WORKERS'], len(unique))
+        if body.get('parallel') and workers > 1:
+            pool = ThreadPool(workers)
+            try:
+                results = pool.map(BatchResource.__dispatch, unique)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [BatchResource.__dispatch(x) for x in unique]
+
+        results = dict(zip(unique, results))
+
+        return {
+            'responses': [
+                dict(results[key], path=path)
+                for path, key in zip(paths, normalized)
+            ]
+        }
+
+    @staticmethod
+    def __normalize(path):
+        """Normalize an URL, so identical requests are equal
+
+        :param path str Sub-request URL
+        :return str Path with the sorted query string
+        """
+        url = url_parse(path)
+        args = sorted(url_decode(url.query).items(multi=True))
+        if not args:
+            return url.path
+
+        return '{0}?{1}'.format(url.path, url_encode(args))
+
+    @staticmethod
+    def __dispatch(path):
+        """Execute a GET sub-request
+
+        :param path str Normalized sub-request URL
+        :return dict Status and the decoded body of the response
+        """
+        if path.rstrip('/') == '/batch':
+            return {'status': 400, 'body': None}
+
+        with app.test_request_context(path, method='GET'):
+            response = app.full_dispatch_request()
+            data = response.get_data(as_text=True)
+
+        try:
+            data = json.loads(data)
+        except ValueError:
+            pass
+
+        return {'status': response.status_code, 'body': data}
+
+
 class RootResource(restful.Resource):
-    """Return links to all entry points"""
+    """Return links to all entry points
+
+    The entry points are derived from the registered routes of resources
+    having an entry_point name (and optionally query_params and
+    url_params_aliases), unless a resource sets its url_template. The
+    documents are precomputed and served as pre-encoded JSON.
+    """
 
     list_type_regex = {
         'angular': {
@@ -242,6 +640,10 @@ class RootResource(restful.Resource):
             'removeQueryParams': re.compile(r'\{\?.+\}')
         }
     }
+    url_param_regex = re.compile(r'^<(?:[^:>]+:)?(\w+)>$')
+    list_types = ('default', 'angular-resource')
+    # Encoded documents keyed by (SERVER_URL, list type)
+    documents = {}
 
     def __init__(self):
         self.arg_parser = reqparse.RequestParser()
@@ -257,51 +659,105 @@ class RootResource(restful.Resource):
         :return dict All entry points
         """
         args = self.arg_parser.parse_args()
-        entry_points = {
-            'configUrl': RootResource.__get_entry_point(
-                '/config'
-            ),
-            'organizationListUrl': RootResource.__get_entry_point(
-                '/organization{?year}'
-            ),
-            'organizationListAllUrl': RootResource.__get_entry_point(
-                '/organization/all'
-            ),
-            'organizationUrl': RootResource.__get_entry_point(
-                '/organization/{year}{/name}'
-            ),
-            'organizationRankUrl': RootResource.__get_entry_point(
-                '/organization/{year}{/name}/rank'
-            ),
-            'organizationStatsUrl': RootResource.__get_entry_point(
-                '/organization/{year}{/name}/stats'
-            ),
-            'studentUrl': RootResource.__get_entry_point(
-                '/student/{name}/{year}{/org_name}'
-            ),
-            'taskListUrl': RootResource.__get_entry_point(
-                '/task{?org,year,limit,offset}'
-            ),
-            'taskUrl': RootResource.__get_entry_point(
-                '/task/{id}'
-            )
-        }
-        if args.get('listType').lower() == 'angular-resource':
-            # Return the list in Angular Resource style
-            for name, url in entry_points.items():
-                # Remove Query Params
-                url = re.sub(
-                    self.list_type_regex['angular']['removeQueryParams'],
-                    '', url
-                )
-                # Replace URL Params
-                url = re.sub(
-                    self.list_type_regex['angular']['replaceURLParams'],
-                    '/:\g<2>', url
+        list_type = args.get('listType').lower()
+        if list_type not in self.list_types:
+            list_type = 'default'
+
+        key = (app.config.get('SERVER_URL'), list_type)
+        if key not in RootResource.documents:
+            RootResource.precompute()
+
+        return precomputed_response(RootResource.documents[key])
+
+    @staticmethod
+    def precompute():
+        """Encode the entry points documents of all list types"""
+        entry_points = RootResource.__get_entry_points()
+        server_url = app.config.get('SERVER_URL')
+        for list_type in RootResource.list_types:
+            document = dict(entry_points)
+            if list_type == 'angular-resource':
+                # Return the list in Angular Resource style
+                regex = RootResource.list_type_regex['angular']
+                for name, url in document.items():
+                    # Remove Query Params
+                    url = re.sub(regex['removeQueryParams'], '', url)
+                    # Replace URL Params
+                    url = re.sub(regex['replaceURLParams'], '/:\g<2>', url)
+                    document[name] = url
+
+            key = (server_url, list_type)
+            RootResource.documents[key] = encode_json(document)
+
+    @staticmethod
+    def __get_entry_points():
+        """Get URL templates of the registered resources
+
+        :return dict Entry point URLs keyed by their names
+        """
+        rules = {}
+        for rule in app.url_map.iter_rules():
+            view = app.view_functions.get(rule.endpoint)
+            resource = getattr(view, 'view_class', None)
+            if getattr(resource, 'entry_point', None) is not None:
+                rules.setdefault(resource, []).append(rule.rule)
+
+        return dict(
+            (
+                resource.entry_point,
+                RootResource.__get_entry_point(
+                    RootResource.__get_template(resource, resource_rules)
                 )
-                entry_points[name] = url
+            )
+            for resource, resource_rules in rules.items()
+        )
 
-        return entry_points
+    @staticmethod
+    def __get_template(resource, rules):
+        """Merge routes of a resource into an URL template
+
+        e.g., /organization/<int:year>/rank and
+        /organization/<int:year>/<name>/rank become
+        /organization/{year}{/name}/rank
+
+        :param resource type Resource class
+        :param rules list Routes of the resource
+        :return str URL template
+        """
+        if getattr(resource, 'url_template', None) is not None:
+            return resource.url_template
+
+        aliases = getattr(resource, 'url_params_aliases', {})
+
+        def segments(rule):
+            result = []
+            for part in rule.split('/'):
+                if not part:
+                    continue
+                match = RootResource.url_param_regex.match(part)
+                if match is None:
+                    result.append((False, part))
+                else:
+                    name = match.group(1)
+                    result.append((True, aliases.get(name, name)))
+            return result
+
+        rules = sorted((segments(x) for x in rules), key=len)
+        required = set(name for is_param, name in rules[0] if is_param)
+        template = ''
+        for is_param, name in rules[-1]:
+            if not is_param:
+                template += '/' + name
+            elif name in required:
+                template += '/{' + name + '}'
+            else:
+                template += '{/' + name + '}'
+
+        query_params = getattr(resource, 'query_params', ())
+        if query_params:
+            template += '{?' + ','.join(query_params) + '}'
+
+        return template
 
     @staticmethod
     def __get_entry_point(resource):
@@ -319,16 +775,39 @@ class RootResource(restful.Resource):
 class ConfigResource(restful.Resource):
     """Get yagcil config"""
 
+    entry_point = 'configUrl'
+    # Encoded documents keyed by the years
+    documents = {}
+
     @staticmethod
     def get():
-        return {
+        key = tuple(app.config['YEARS'])
+        if key not in ConfigResource.documents:
+            ConfigResource.precompute()
+
+        return precomputed_response(ConfigResource.documents[key])
+
+    @staticmethod
+    def precompute():
+        """Encode the config document"""
+        ConfigResource.documents[tuple(app.config['YEARS'])] = encode_json({
             'activeYear': max(app.config['YEARS']),
             'years': app.config['YEARS']
-        }
+        })
 
 api.add_resource(OrganizationListResource, '/organization')
 api.add_resource(AllOrganizationListResource, '/organization/all')
 api.add_resource(OrganizationResource, '/organization/<int:year>/<name>')
+api.add_resource(
+    AllYearsRankResource,
+    '/organization/all/rank',
+    '/organization/all/<name>/rank'
+)
+api.add_resource(
+    AllYearsStatsResource,
+    '/organization/all/stats',
+    '/organization/all/<name>/stats'
+)
 api.add_resource(
     OrganizationRankResource,
     '/organization/<int:year>/rank',
@@ -349,5 +828,10 @@ api.add_resource(
     '/student/<name>/<int:year>/<org_name>/'
 )
 
+api.add_resource(BatchResource, '/batch')
+
 api.add_resource(RootResource, '/')
 api.add_resource(ConfigResource, '/config')
+
+RootResource.precompute()
+ConfigResource.precompute()
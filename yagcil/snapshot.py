@@ -0,0 +1,400 @@
+"""
+    In-memory columnar snapshot of the tasks and organizations
+
+    The data only changes when update_db.py publishes a new generation,
+    so the read API can be answered from a compact in-process copy.
+    The snapshot is reloaded in the background after every generation
+    and swapped atomically, while it's stale the resources use MongoDB.
+"""
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from yagcil import app, analytics
+from yagcil.cache import generation
+from yagcil.models import Organization, Task, api_field_names
+
+try:
+    array('q')
+    KEY_TYPECODE = 'q'
+except ValueError:
+    KEY_TYPECODE = 'l'
+
+
+class StringTable(object):
+    """Interned strings encoded as integer codes"""
+
+    def __init__(self):
+        self.strings = []
+        self.codes = {}
+
+    def encode(self, string):
+        """Get the code of a string, adding it to the table
+
+        :param string str String to encode
+        :return int Code of the string
+        """
+        code = self.codes.get(string)
+        if code is None:
+            code = self.codes[string] = len(self.strings)
+            self.strings.append(string)
+
+        return code
+
+    def nbytes(self):
+        """Approximate memory footprint in bytes"""
+        return (
+            sys.getsizeof(self.strings) + sys.getsizeof(self.codes) +
+            sum(sys.getsizeof(x) for x in self.strings)
+        )
+
+
+class Snapshot(object):
+    """Read-only columnar copy of the tasks and organizations
+
+    The tasks are stored sorted by their key in array-backed columns:
+    keys, years, org codes, student codes, titles and categories (codes
+    of all the categories with per-task offsets). Rows of each year,
+    organization and (year, student) are precomputed.
+
+    Statistics are computed by yagcil.analytics if NumPy is available.
+
+    :var generation int Data generation of the snapshot
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.strings = StringTable()
+        # Organizations
+        self.org_codes = {}
+        self.org_names = []
+        # Task columns
+        self.keys = array(KEY_TYPECODE)
+        self.years = array('i')
+        self.task_orgs = array('i')
+        self.students = array('i')
+        self.titles = []
+        self.category_offsets = array('i', [0])
+        self.categories = array('i')
+        # Indexes (rows sorted by the task key)
+        self.by_year = defaultdict(lambda: array('i'))
+        self.by_org = defaultdict(lambda: array('i'))
+        self.by_student = defaultdict(lambda: array('i'))
+        # NumPy views of the columns, see __arrays()
+        self.arrays = None
+        # Ranks and positions keyed by (year, org name), see ranking()
+        self.rankings = {}
+
+    @staticmethod
+    def load(generation):
+        """Load all the tasks and organizations
+
+        :param generation int Data generation being loaded
+        :return Snapshot The loaded snapshot
+        """
+        snapshot = Snapshot(generation)
+        org_ids = {}
+        # The id has to be listed, as_pymongo() leaves it out otherwise
+        orgs = Organization.objects.only('id', 'name', 'year')
+        for org in orgs.as_pymongo():
+            code = len(snapshot.org_names)
+            org_ids[org['_id']] = code
+            snapshot.org_codes[(org['year'], org['name'])] = code
+            snapshot.org_names.append(snapshot.strings.encode(org['name']))
+
+        tasks = Task.objects.order_by('key').only(*api_field_names(Task))
+        for row, task in enumerate(tasks.no_cache().as_pymongo()):
+            year = task['year']
+            org = org_ids.get(task.get('org'), -1)
+            student = snapshot.strings.encode(task['student'])
+            snapshot.keys.append(task['_id'])
+            snapshot.years.append(year)
+            snapshot.task_orgs.append(org)
+            snapshot.students.append(student)
+            snapshot.titles.append(task['title'])
+            snapshot.categories.extend(
+                snapshot.strings.encode(x) for x in task.get('categories', [])
+            )
+            snapshot.category_offsets.append(len(snapshot.categories))
+
+            snapshot.by_year[year].append(row)
+            snapshot.by_org[org].append(row)
+            snapshot.by_student[(year, student)].append(row)
+
+        return snapshot
+
+    def __len__(self):
+        return len(self.keys)
+
+    def nbytes(self):
+        """Approximate memory footprint in bytes"""
+        columns = [
+            self.keys, self.years, self.task_orgs, self.students,
+            self.category_offsets, self.categories
+        ]
+        for index in (self.by_year, self.by_org, self.by_student):
+            columns.extend(index.values())
+
+        return (
+            sum(x.buffer_info()[1] * x.itemsize for x in columns) +
+            sys.getsizeof(self.titles) +
+            sum(sys.getsizeof(x) for x in self.titles) +
+            self.strings.nbytes()
+        )
+
+    def rows(self, year, org_name=None, student=None):
+        """Get rows of the tasks matching the filters
+
+        :param year int GCI year
+        :param org_name str Organization's name
+        :param student str Student's name
+        :return array|None Rows sorted by the task key, None if the
+                           organization doesn't exist
+        """
+        org = None
+        if org_name is not None:
+            org = self.org_codes.get((year, org_name))
+            if org is None:
+                return None
+
+        if student is not None:
+            code = self.strings.codes.get(student)
+            rows = self.by_student.get((year, code), array('i'))
+            if org is not None:
+                rows = array(
+                    'i', (x for x in rows if self.task_orgs[x] == org)
+                )
+            return rows
+
+        if org is not None:
+            return self.by_org.get(org, array('i'))
+
+        return self.by_year.get(year, array('i'))
+
+    def after(self, rows, key):
+        """Get the rows of the tasks with a key greater than the given one
+
+        :param rows array Rows sorted by the task key
+        :param key int Task key
+        :return array The following rows
+        """
+        return rows[bisect_left(rows, bisect_right(self.keys, key)):]
+
+    def task(self, row):
+        """Serialize a task, the same as Task.to_dict()
+
+        :param row int Row of the task
+        :return dict Serialized task
+        """
+        org = self.task_orgs[row]
+        strings = self.strings.strings
+        categories = self.categories[
+            self.category_offsets[row]:self.category_offsets[row + 1]
+        ]
+
+        return {
+            'id': self.keys[row],
+            'title': self.titles[row],
+            'orgName': strings[self.org_names[org]] if org >= 0 else None,
+            'year': self.years[row],
+            'student': strings[self.students[row]],
+            'categories': [strings[x] for x in categories]
+        }
+
+    def iter_tasks(self, rows):
+        """Serialize tasks lazily
+
+        :param rows iterable Rows of the tasks
+        :return generator Serialized tasks
+        """
+        for row in rows:
+            yield self.task(row)
+
+    def __arrays(self):
+        """Get NumPy views of the columns, created on the first use
+
+        :return dict NumPy arrays
+        """
+        if self.arrays is None:
+            self.arrays = {
+                'students': analytics.as_codes(self.students),
+                'category_offsets': analytics.as_codes(self.category_offsets),
+                'categories': analytics.as_codes(self.categories),
+                'name_ranks': analytics.name_ranks(self.strings.strings)
+            }
+
+        return self.arrays
+
+    def rank(self, rows):
+        """Rank students, the same as Task.rank()
+
+        :param rows array Rows of the ranked tasks
+        :return list Students sorted by the number of tasks
+        """
+        strings = self.strings.strings
+        if analytics.available:
+            arrays = self.__arrays()
+            students, counts = analytics.rank(
+                arrays['students'][analytics.as_codes(rows)],
+                arrays['name_ranks']
+            )
+            return [
+                {'student': strings[student], 'tasks': int(count)}
+                for student, count in zip(students, counts)
+            ]
+
+        counts = defaultdict(int)
+        for row in rows:
+            counts[self.students[row]] += 1
+
+        rank = [
+            {'student': strings[student], 'tasks': count}
+            for student, count in counts.items()
+        ]
+        rank.sort(key=lambda x: (-x['tasks'], x['student']))
+
+        return rank
+
+    def ranking(self, year, org_name=None):
+        """Get the rank of a year or an org, computed on the first use
+
+        :param year int GCI year
+        :param org_name str Organization's name, None for the whole year
+        :return tuple (rank, positions of the students starting at 1)
+        """
+        ranking = self.rankings.get((year, org_name))
+        if ranking is None:
+            rank = self.rank(self.rows(year, org_name) or array('i'))
+            positions = dict(
+                (item['student'], position)
+                for position, item in enumerate(rank, 1)
+            )
+            ranking = self.rankings[(year, org_name)] = (rank, positions)
+
+        return ranking
+
+    def rank_position(self, year, org_name, student):
+        """Get a student's position in the rank of a year or an org
+
+        :param year int GCI year
+        :param org_name str Organization's name, None for the whole year
+        :param student str Student's name
+        :return int|None Position starting at 1, None if the student
+                         has no tasks
+        """
+        _, positions = self.ranking(year, org_name)
+
+        return positions.get(student)
+
+    def count_categories(self, rows):
+        """Count categories, the same as Task.count_categories()
+
+        :param rows array Rows of the tasks
+        :return dict A number of tasks in each category
+        """
+        strings = self.strings.strings
+        if analytics.available:
+            arrays = self.__arrays()
+            categories, counts = analytics.histogram(
+                analytics.gather(
+                    arrays['category_offsets'], arrays['categories'],
+                    analytics.as_codes(rows)
+                ),
+                len(strings)
+            )
+            return dict(
+                (strings[category], int(count))
+                for category, count in zip(categories, counts)
+            )
+
+        counts = defaultdict(int)
+        for row in rows:
+            start, end = self.category_offsets[row:row + 2]
+            for category in self.categories[start:end]:
+                counts[category] += 1
+
+        return dict((strings[x], count) for x, count in counts.items())
+
+
+class SnapshotEngine(object):
+    """Holder of the snapshot of the current data generation
+
+    Enabled by SNAPSHOT_ENGINE config.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.lock = threading.Lock()
+        self.loading = False
+
+    def get(self):
+        """Get the snapshot of the current data generation
+
+        A stale snapshot is never returned; it's reloaded in the
+        background in the meantime.
+
+        :return Snapshot|None The snapshot, None if it's disabled or
+                              not loaded yet
+        """
+        if not app.config.get('SNAPSHOT_ENGINE'):
+            return None
+
+        snapshot = self.snapshot
+        current = generation.current()
+        if snapshot is not None and snapshot.generation == current:
+            return snapshot
+
+        with self.lock:
+            if self.loading:
+                return None
+            self.loading = True
+
+        thread = threading.Thread(target=self.__background_reload)
+        thread.daemon = True
+        thread.start()
+
+        return None
+
+    def __background_reload(self):
+        try:
+            self.reload()
+        except Exception:
+            app.logger.exception('Failed to load the snapshot')
+        finally:
+            with self.lock:
+                self.loading = False
+
+    def reload(self):
+        """Load the snapshot of the current generation and swap it in
+
+        :return Snapshot The loaded snapshot
+        """
+        snapshot = Snapshot.load(generation.current())
+        # Swapping the reference is atomic, readers see either snapshot
+        self.snapshot = snapshot
+        app.logger.info(
+            'Loaded snapshot of generation %d: %d tasks, %d bytes',
+            snapshot.generation, len(snapshot), snapshot.nbytes()
+        )
+
+        return snapshot
+
+    def stats(self):
+        """Get the snapshot statistics
+
+        :return dict Generation, number of tasks and memory footprint
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {'generation': None, 'tasks': 0, 'bytes': 0}
+
+        return {
+            'generation': snapshot.generation,
+            'tasks': len(snapshot),
+            'bytes': snapshot.nbytes()
+        }
+
+
+snapshots = SnapshotEngine()